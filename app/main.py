@@ -1,18 +1,40 @@
 import os
+import time
+import secrets
+import asyncio
 import logging
+from functools import partial
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request, HTTPException, status
-from pydantic import BaseModel
-from .ai_brain import get_joke, get_quote, get_humorous_reply
-from .scheduler import set_send_message_func, add_reminder, clear_reminders, get_active_reminders
-import requests
 
-# Load environment variables from .env file
+# Load environment variables from .env file (before the services read their configuration)
 load_dotenv()
 
+from fastapi import FastAPI, Request, HTTPException, Query, Header, status
+from fastapi.responses import Response
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from .services import whatsapp_client
+from .services.work_queue import WorkQueue
+from .services.dedup import SeenCache
+from .services.rate_limiter import RateLimiter, ALLOW, THROTTLE_NOTIFY
+from .services.broadcast import TargetRegistry, Broadcaster
+from .services.receipts import ReceiptSink, ReceiptStore
+from .services.outbox import Outbox
+from .services import webhook_parser
+from .services.metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .services.ai_service import (
+    get_joke, get_quote, get_humorous_reply_async, warm_reservoirs, close_clients, ai_stats,
+    joke_reservoir, quote_reservoir, reply_cache
+)
+from .services.scheduler import (
+    set_send_message_func, add_reminder, clear_reminders,
+    list_reminders, get_reminder_counts, get_scheduler_stats, start_scheduler, stop_scheduler
+)
+from .services.logging_config import configure_logging, start_logging, stop_logging, logging_stats
+
 # --- Configuration ---
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Set up logging: records go through a queue and are written by a listener thread started in the lifespan
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Environment variables
@@ -21,62 +43,197 @@ VERIFY_TOKEN = os.getenv("VERIFY_TOKEN")
 PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
 ADMIN_NUMBERS = [num.strip() for num in os.getenv("ADMIN_NUMBERS", "").split(",") if num.strip()]
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")  # Bearer token for the admin HTTP endpoints (disabled without it)
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "8"))
+WORK_QUEUE_MAX_SIZE = int(os.getenv("WORK_QUEUE_MAX_SIZE", "1000"))
+WORK_QUEUE_FULL_POLICY = os.getenv("WORK_QUEUE_FULL_POLICY", "block")  # "block" (wait briefly) or "shed"
+WORK_QUEUE_BLOCK_TIMEOUT = float(os.getenv("WORK_QUEUE_BLOCK_TIMEOUT", "0.5"))
+WORK_QUEUE_DRAIN_TIMEOUT = float(os.getenv("WORK_QUEUE_DRAIN_TIMEOUT", "10"))
+DEDUP_MAX_SIZE = int(os.getenv("DEDUP_MAX_SIZE", "10000"))
+DEDUP_TTL_SECONDS = float(os.getenv("DEDUP_TTL_SECONDS", "86400"))
+DEDUP_DB_PATH = os.getenv("DEDUP_DB_PATH")  # Optional: persist seen ids across restarts/workers
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Per-sender budgets: burst size and sustained messages per minute for each kind of work
+RATE_LIMIT_AI_BURST = int(os.getenv("RATE_LIMIT_AI_BURST", "5"))
+RATE_LIMIT_AI_PER_MINUTE = float(os.getenv("RATE_LIMIT_AI_PER_MINUTE", "10"))
+RATE_LIMIT_COMMAND_BURST = int(os.getenv("RATE_LIMIT_COMMAND_BURST", "10"))
+RATE_LIMIT_COMMAND_PER_MINUTE = float(os.getenv("RATE_LIMIT_COMMAND_PER_MINUTE", "20"))
+RATE_LIMIT_ADMIN_BURST = int(os.getenv("RATE_LIMIT_ADMIN_BURST", "20"))
+RATE_LIMIT_ADMIN_PER_MINUTE = float(os.getenv("RATE_LIMIT_ADMIN_PER_MINUTE", "60"))
+BOT_DB_PATH = os.getenv("BOT_DB_PATH", "data/bot.db")  # SQLite file for broadcast targets
+BROADCAST_RATE_PER_SECOND = float(os.getenv("BROADCAST_RATE_PER_SECOND", "50"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "32"))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "3"))
+BROADCAST_PROGRESS_EVERY = int(os.getenv("BROADCAST_PROGRESS_EVERY", "100"))
+RECEIPT_BUFFER_SIZE = int(os.getenv("RECEIPT_BUFFER_SIZE", "10000"))
+RECEIPT_FLUSH_SECONDS = float(os.getenv("RECEIPT_FLUSH_SECONDS", "2"))
+RECEIPT_RETENTION_DAYS = float(os.getenv("RECEIPT_RETENTION_DAYS", "30"))
+OUTBOX_SENDERS = int(os.getenv("OUTBOX_SENDERS", "8"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BASE_BACKOFF = float(os.getenv("OUTBOX_BASE_BACKOFF", "1"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))
+
+# Outbound messages are tracked for receipt summaries under these tags.
+BROADCAST_TAG_PREFIX = "broadcast:"
+REMINDER_TAG = "reminders"
+
+GENERAL_COMMANDS = ["/help", "/joke", "/quote"]
+ADMIN_COMMANDS = ["/announce", "/poll", "/remind", "/clear", "/register_group", "/unregister_group", "/list_groups", "/receipts"]
+
+# Incoming messages are processed off the request path by this worker pool.
+work_queue = WorkQueue(
+    worker_count=WORKER_COUNT,
+    max_size=WORK_QUEUE_MAX_SIZE,
+    full_policy=WORK_QUEUE_FULL_POLICY,
+    block_timeout=WORK_QUEUE_BLOCK_TIMEOUT
+)
 
-# Check for essential environment variables
-if not all([WHATSAPP_TOKEN, VERIFY_TOKEN, PHONE_NUMBER_ID]):
-    logger.error("Missing essential environment variables (WHATSAPP_TOKEN, VERIFY_TOKEN, PHONE_NUMBER_ID)")
-    # In a real deployment, you might want to exit or raise an error here.
-    # For now, we'll proceed but log the error.
+# Drops webhook redeliveries (same WhatsApp message id) before any work is queued.
+seen_messages = SeenCache(
+    max_size=DEDUP_MAX_SIZE,
+    ttl_seconds=DEDUP_TTL_SECONDS,
+    db_path=DEDUP_DB_PATH
+)
 
-# --- FastAPI App Initialization ---
-app = FastAPI(
-    title="WhatsApp HOC Bot",
-    description="An AI-powered WhatsApp bot for Class HOCs and Assistant HOCs.",
-    version="1.0.0"
+# Token buckets per sender, checked in the webhook before any command or AI work is queued.
+rate_limiter = RateLimiter(
+    {
+        "ai": (RATE_LIMIT_AI_BURST, RATE_LIMIT_AI_PER_MINUTE / 60),
+        "command": (RATE_LIMIT_COMMAND_BURST, RATE_LIMIT_COMMAND_PER_MINUTE / 60),
+        "admin": (RATE_LIMIT_ADMIN_BURST, RATE_LIMIT_ADMIN_PER_MINUTE / 60),
+    },
+    enabled=RATE_LIMIT_ENABLED
+)
+
+# Every outbound message goes through this durable SQLite queue, so a Graph API
+# outage or a restart delays messages instead of losing them.
+outbox = Outbox(
+    BOT_DB_PATH,
+    whatsapp_client.send_message,
+    sender_count=OUTBOX_SENDERS,
+    max_attempts=OUTBOX_MAX_ATTEMPTS,
+    base_backoff=OUTBOX_BASE_BACKOFF,
+    max_backoff=OUTBOX_MAX_BACKOFF,
+    on_sent=lambda row, response: on_outbox_sent(row, response)
+)
+
+# Named announcement targets and the paced fan-out engine for /announce @<alias|all>.
+# Broadcast recipients are reserved in the outbox before the fan-out starts.
+broadcast_targets = TargetRegistry(BOT_DB_PATH)
+broadcaster = Broadcaster(
+    whatsapp_client.send_message,
+    outbox,
+    rate_per_second=BROADCAST_RATE_PER_SECOND,
+    concurrency=BROADCAST_CONCURRENCY,
+    max_attempts=BROADCAST_MAX_ATTEMPTS,
+    progress_every=BROADCAST_PROGRESS_EVERY,
+    tag_prefix=BROADCAST_TAG_PREFIX
 )
 
-# Inject the send_whatsapp_message function into the scheduler module
-set_send_message_func(send_whatsapp_message)
+# Delivery/read receipts go here straight from the raw webhook body, without model validation,
+# and are written to SQLite in batches together with the ids of tracked outbound messages.
+receipt_sink = ReceiptSink(max_buffer=RECEIPT_BUFFER_SIZE)
+receipt_store = ReceiptStore(
+    BOT_DB_PATH,
+    receipt_sink,
+    flush_interval=RECEIPT_FLUSH_SECONDS,
+    retention_days=RECEIPT_RETENTION_DAYS
+)
+
+
+# --- Metrics ---
+WEBHOOK_SECONDS = REGISTRY.histogram("whatsapp_webhook_seconds", "Webhook handling latency by payload kind.", ("kind",))
+# handler is the command (unknown commands count as "unknown") or "ai_reply" for chat messages
+DISPATCH_SECONDS = REGISTRY.histogram("whatsapp_dispatch_seconds", "Time to handle one incoming message.", ("handler",))
+REGISTRY.gauge_func("whatsapp_work_queue_depth", "Messages waiting for a worker.", lambda: work_queue.stats()["depth"])
+REGISTRY.gauge_func("whatsapp_outbox_pending", "Outbound messages queued in the outbox (all workers).", outbox.pending_count)
+REGISTRY.gauge_func("whatsapp_scheduler_running_jobs", "Reminder scheduler jobs running.", lambda: get_scheduler_stats()["running_jobs"])
+REGISTRY.gauge_func("whatsapp_reminders_pending", "Stored reminders not yet delivered.", lambda: get_reminder_counts()["pending"])
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Application context: nothing with threads, sockets, database files or heavy imports starts at import time.
+    Startup configures the WhatsApp client, starts the message workers and the reminder scheduler,
+    and warms the AI pools in the background. Shutdown drains queued work and broadcasts, stops the
+    scheduler and flushes its pending reminders into the outbox, then closes the HTTP clients.
+    """
+    start_logging()
+    # Check for essential environment variables
+    if not all([WHATSAPP_TOKEN, VERIFY_TOKEN, PHONE_NUMBER_ID]):
+        logger.error("Missing essential environment variables (WHATSAPP_TOKEN, VERIFY_TOKEN, PHONE_NUMBER_ID)")
+        # In a real deployment, you might want to exit or raise an error here.
+        # For now, we'll proceed but log the error.
+
+    whatsapp_client.configure(WHATSAPP_TOKEN, PHONE_NUMBER_ID)
+    await whatsapp_client.start()
+    await outbox.start()
+    await work_queue.start()
+    await receipt_store.start()
+    # Due reminders are queued in the outbox straight from the scheduler's flush thread
+    set_send_message_func(partial(send_whatsapp_message_sync, tag=REMINDER_TAG))
+    start_scheduler()
+    warm_reservoirs()
+    yield
+    await work_queue.stop(timeout=WORK_QUEUE_DRAIN_TIMEOUT)
+    await broadcaster.stop(timeout=WORK_QUEUE_DRAIN_TIMEOUT)
+    # Runs in a thread: stopping waits for running reminder jobs.
+    await asyncio.to_thread(stop_scheduler)
+    # Whatever can't go out in time stays queued on disk and is sent after the restart.
+    await outbox.stop(timeout=WORK_QUEUE_DRAIN_TIMEOUT)
+    await receipt_store.stop()
+    await close_clients()
+    await whatsapp_client.close()
+    # Records logged after this are written at process exit.
+    stop_logging()
+
+
+# --- FastAPI App Initialization ---
+app = FastAPI(
     title="WhatsApp HOC Bot",
     description="An AI-powered WhatsApp bot for Class HOCs and Assistant HOCs.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # --- Helper Functions ---
 
-def send_whatsapp_message(recipient_id: str, message_body: str, message_type: str = "text"):
-    """Sends a message back to the WhatsApp user/group."""
-    if not WHATSAPP_TOKEN or not PHONE_NUMBER_ID:
-        logger.error("Cannot send message: WHATSAPP_TOKEN or PHONE_NUMBER_ID is missing.")
-        return False
-
-    url = f"https://graph.facebook.com/v19.0/{PHONE_NUMBER_ID}/messages"
-    headers = {
-        "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-        "Content-Type": "application/json",
-    }
-    
-    # Basic text message structure
-    # Note: WhatsApp Cloud API uses 'individual' for both individual and group chats
-    # The 'to' number is the ID of the user/group that sent the message.
-    # The API automatically handles sending to the right place.
-    payload = {
-        "messaging_product": "whatsapp",
-        "recipient_type": "individual",
-        "to": recipient_id,
-        "type": message_type,
-        "text": {"body": message_body}
-    }
-    
+def record_outbound(response: dict, recipient_id: str, tag: str):
+    """Remembers the WhatsApp message id of a tracked send so its receipts count toward `tag`."""
+    try:
+        message_id = response["messages"][0]["id"]
+    except (KeyError, IndexError, TypeError):
+        logger.warning(f"No message id in send response for {recipient_id}; receipts for it won't be tracked.")
+        return
+    receipt_sink.record_sent(message_id, tag, recipient_id)
+
+def on_outbox_sent(row: dict, response: dict):
+    logger.info(f"Message {row['id']} sent to {row['recipient_id']}.", extra={"category": "send"})
+    if row["tag"]:
+        record_outbound(response, row["recipient_id"], row["tag"])
+
+def send_whatsapp_message_sync(recipient_id: str, message_body: str, message_type: str = "text", tag: str = None) -> bool:
+    """
+    Queues a message to the WhatsApp user/group in the durable outbox; the outbox's senders
+    deliver it over the pooled async client, retrying transient failures.
+    With a `tag`, the message's delivery/read receipts are aggregated under it.
+    Blocks on the SQLite insert, so it is meant for worker threads (e.g. the scheduler's).
+    """
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-        logger.info(f"Message sent successfully to {recipient_id}. Response: {response.json()}")
+        outbox.enqueue(recipient_id, message_body, message_type, tag)
         return True
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to send message to {recipient_id}: {e}")
+    except Exception as e:
+        logger.error(f"Failed to queue message to {recipient_id}: {e}")
         return False
 
+async def send_whatsapp_message(recipient_id: str, message_body: str, message_type: str = "text", tag: str = None) -> bool:
+    """
+    Async variant of send_whatsapp_message_sync. The insert runs in a worker thread, so a
+    slow or contended SQLite write never blocks the event loop.
+    """
+    return await asyncio.to_thread(send_whatsapp_message_sync, recipient_id, message_body, message_type, tag)
+
 def is_admin(sender_number: str) -> bool:
     """Checks if the sender's number is in the list of authorized admin numbers."""
     # WhatsApp API numbers often come with a '+' prefix and country code.
@@ -85,7 +242,7 @@ def is_admin(sender_number: str) -> bool:
     admin_list = [num.lstrip('+') for num in ADMIN_NUMBERS]
     return sender_number in admin_list
 
-def handle_command(sender_id: str, message_text: str):
+async def handle_command(sender_id: str, message_text: str):
     """Parses and executes bot commands."""
     
     # 1. Parse command and arguments
@@ -94,12 +251,11 @@ def handle_command(sender_id: str, message_text: str):
     args = parts[1] if len(parts) > 1 else ""
     
     # 2. Check for admin commands and permissions
-    admin_commands = ["/announce", "/poll", "/remind", "/clear"]
     is_authorized = is_admin(sender_id)
     
-    if command in admin_commands and not is_authorized:
+    if command in ADMIN_COMMANDS and not is_authorized:
         reply = "🚫 *Permission Denied*. Only HOCs and Assistant HOCs can use this command."
-        send_whatsapp_message(sender_id, reply)
+        await send_whatsapp_message(sender_id, reply)
         logger.warning(f"Unauthorized command attempt: {sender_id} tried {command}")
         return
 
@@ -109,6 +265,11 @@ def handle_command(sender_id: str, message_text: str):
             "🤖 *HOC Bot Commands* 🤖\n\n"
             "**Admin Commands (HOC/Asst HOC only):**\n"
             "• `/announce <message>`: Send a formal announcement.\n"
+            "• `/announce @<alias|all> <message>`: Broadcast an announcement to registered groups.\n"
+            "• `/register_group <alias> [numbers...]`: Add this chat (or the given numbers) to a group.\n"
+            "• `/unregister_group <alias> [numbers...]`: Remove numbers (or the whole group).\n"
+            "• `/list_groups`: List registered groups.\n"
+            "• `/receipts [broadcast id|tag]`: Delivery and read rates of recent broadcasts and reminders.\n"
             "• `/poll <question> | <opt1>, <opt2>`: Create a quick poll (WIP - not fully implemented).\n"
             "• `/remind <time> <message>`: Set a timed reminder (e.g., `/remind 10m Submit report`).\n"
             "• `/clear`: Clear all scheduled reminders.\n\n"
@@ -117,117 +278,210 @@ def handle_command(sender_id: str, message_text: str):
             "• `/quote`: Get a motivational quote.\n"
             "• `/help`: Show this list of commands."
         )
-        send_whatsapp_message(sender_id, reply)
+        await send_whatsapp_message(sender_id, reply)
         
     elif command == "/announce":
-        if args:
+        if args.startswith("@"):
+            # Broadcast to a registered group (or every group) in the background
+            target, _, body = args[1:].partition(" ")
+            target = broadcast_targets.normalize_alias(target)
+            if not target or not body.strip():
+                await send_whatsapp_message(sender_id, "⚠️ Usage: `/announce @<alias|all> <message>`")
+                return
+            if not broadcast_targets.has(target):
+                await send_whatsapp_message(sender_id, f"⚠️ No group named *{target}*. Use `/list_groups` to see registered groups.")
+                return
+            recipients = broadcast_targets.recipients(target)
+            if not recipients:
+                await send_whatsapp_message(sender_id, "ℹ️ No registered recipients. Use `/register_group <alias>` first.")
+                return
+            announcement_text = f"📣 *CLASS ANNOUNCEMENT*\n\n{body.strip()}"
+            await send_whatsapp_message(sender_id, f"📤 Broadcasting to {len(recipients)} recipients in *{target}*...")
+            broadcaster.launch(run_broadcast(sender_id, target, recipients, announcement_text))
+            logger.info(f"Broadcast to '{target}' ({len(recipients)} recipients) started by {sender_id}")
+        elif args:
             # Announcement logic
             announcement_text = f"📣 *CLASS ANNOUNCEMENT*\n\n{args}"
-            send_whatsapp_message(sender_id, announcement_text)
-            logger.info(f"Announcement sent by {sender_id}: {args}")
+            await send_whatsapp_message(sender_id, announcement_text)
+            logger.info(f"Announcement sent by {sender_id} ({len(args)} chars).")
         else:
-            send_whatsapp_message(sender_id, "⚠️ Usage: `/announce <message>`")
+            await send_whatsapp_message(sender_id, "⚠️ Usage: `/announce <message>` or `/announce @<alias|all> <message>`")
+
+    elif command == "/register_group":
+        if args:
+            alias, *numbers = args.split()
+            added = broadcast_targets.add(alias, numbers or [sender_id])
+            await send_whatsapp_message(sender_id, f"✅ Added {added} recipient(s) to *{broadcast_targets.normalize_alias(alias)}*.")
+        else:
+            await send_whatsapp_message(sender_id, "⚠️ Usage: `/register_group <alias> [numbers...]`")
+
+    elif command == "/unregister_group":
+        if args:
+            alias, *numbers = args.split()
+            removed = broadcast_targets.remove(alias, numbers)
+            await send_whatsapp_message(sender_id, f"✅ Removed {removed} recipient(s) from *{broadcast_targets.normalize_alias(alias)}*.")
+        else:
+            await send_whatsapp_message(sender_id, "⚠️ Usage: `/unregister_group <alias> [numbers...]`")
+
+    elif command == "/list_groups":
+        groups = broadcast_targets.aliases()
+        if groups:
+            lines = "\n".join(f"• *{alias}*: {count} recipient(s)" for alias, count in groups.items())
+            await send_whatsapp_message(sender_id, f"👥 *Registered Groups*\n\n{lines}")
+        else:
+            await send_whatsapp_message(sender_id, "ℹ️ No groups registered yet. Use `/register_group <alias>`.")
+
+    elif command == "/receipts":
+        if args:
+            # A bare id is a broadcast id; full tags ("reminders", "broadcast:<id>") are used as given.
+            tag = args.strip()
+            if tag != REMINDER_TAG and ":" not in tag:
+                tag = f"{BROADCAST_TAG_PREFIX}{tag}"
+            summaries = receipt_store.summaries(tag=tag)
+        else:
+            summaries = receipt_store.summaries(limit=5)
+        if summaries:
+            await send_whatsapp_message(sender_id, "📬 *Delivery Receipts*\n\n" + "\n".join(format_receipt_summary(s) for s in summaries))
+        else:
+            await send_whatsapp_message(sender_id, "ℹ️ No receipts recorded yet for that broadcast.")
 
     elif command == "/remind":
         if args:
             try:
                 time_str, message = args.split(maxsplit=1)
                 response = add_reminder(sender_id, time_str, message)
-                send_whatsapp_message(sender_id, response)
+                await send_whatsapp_message(sender_id, response)
             except ValueError:
-                send_whatsapp_message(sender_id, "⚠️ Usage: `/remind <time> <message>` (e.g., `/remind 10m Submit report`)")
+                await send_whatsapp_message(sender_id, "⚠️ Usage: `/remind <time> <message>` (e.g., `/remind 10m Submit report`)")
         else:
-            send_whatsapp_message(sender_id, "⚠️ Usage: `/remind <time> <message>`")
+            await send_whatsapp_message(sender_id, "⚠️ Usage: `/remind <time> <message>`")
             
     elif command == "/clear":
         response = clear_reminders(sender_id)
-        send_whatsapp_message(sender_id, response)
+        await send_whatsapp_message(sender_id, response)
 
     elif command == "/joke":
         joke = get_joke()
-        send_whatsapp_message(sender_id, f"😂 *Joke Time* 😂\n\n{joke}")
+        await send_whatsapp_message(sender_id, f"😂 *Joke Time* 😂\n\n{joke}")
 
     elif command == "/quote":
         quote = get_quote()
-        send_whatsapp_message(sender_id, f"💡 *Motivation Boost* 💡\n\n{quote}")
+        await send_whatsapp_message(sender_id, f"💡 *Motivation Boost* 💡\n\n{quote}")
             
     elif command == "/poll":
         # Placeholder for poll functionality - requires more complex API interaction
-        send_whatsapp_message(sender_id, "🚧 *Poll Command (WIP)* 🚧\n\nThis feature is complex and requires specific WhatsApp API templates. For now, please use an external tool or the `/announce` command.")
-            
-    else:
-        # Unknown command
-        reply = "⚠️ *Unknown command*. Type `/help` to see available commands."
-        send_whatsapp_message(sender_id, reply)
-    """Parses and executes bot commands."""
-    
-    # 1. Parse command and arguments
-    parts = message_text.strip().split(maxsplit=1)
-    command = parts[0].lower()
-    args = parts[1] if len(parts) > 1 else ""
-    
-    # 2. Check for admin commands and permissions
-    admin_commands = ["/announce", "/poll", "/remind", "/clear"]
-    is_authorized = is_admin(sender_id)
-    
-    if command in admin_commands and not is_authorized:
-        reply = "🚫 *Permission Denied*. Only HOCs and Assistant HOCs can use this command."
-        send_whatsapp_message(sender_id, reply)
-        logger.warning(f"Unauthorized command attempt: {sender_id} tried {command}")
-        return
-
-    # 3. Execute command
-    if command == "/help":
-        reply = (
-            "🤖 *HOC Bot Commands* 🤖\n\n"
-            "**Admin Commands (HOC/Asst HOC only):**\n"
-            "• `/announce <message>`: Send a formal announcement.\n"
-            "• `/poll <question> | <opt1>, <opt2>`: Create a quick poll (WIP).\n"
-            "• `/remind <time> <message>`: Set a timed reminder (e.g., `/remind 10m Submit report`).\n"
-            "• `/clear`: Clear all scheduled reminders.\n\n"
-            "**General Commands (Everyone):**\n"
-            "• `/joke`: Get a random funny student-related joke.\n"
-            "• `/quote`: Get a motivational quote.\n"
-            "• `/help`: Show this list of commands."
-        )
-        send_whatsapp_message(sender_id, reply)
-        
-    elif command == "/announce":
-        if args:
-            # Placeholder for actual announcement logic (e.g., formatting, logging)
-            announcement_text = f"📣 *CLASS ANNOUNCEMENT*\n\n{args}"
-            send_whatsapp_message(sender_id, announcement_text)
-            logger.info(f"Announcement sent by {sender_id}: {args}")
-        else:
-            send_whatsapp_message(sender_id, "⚠️ Usage: `/announce <message>`")
+        await send_whatsapp_message(sender_id, "🚧 *Poll Command (WIP)* 🚧\n\nThis feature is complex and requires specific WhatsApp API templates. For now, please use an external tool or the `/announce` command.")
             
-    # Add other command handlers here (e.g., /joke, /remind, /poll) in Phase 3
-    
     else:
         # Unknown command
         reply = "⚠️ *Unknown command*. Type `/help` to see available commands."
-        send_whatsapp_message(sender_id, reply)
+        await send_whatsapp_message(sender_id, reply)
 
-def handle_ai_reply(sender_id: str, message_text: str):
+async def handle_ai_reply(sender_id: str, message_text: str):
     """Handles non-command messages with an AI-generated, humorous reply."""
-    logger.info(f"Non-command message from {sender_id}. Engaging AI reply...")
+    logger.debug(f"Non-command message from {sender_id}. Engaging AI reply...", extra={"category": "inbound"})
     
     # Check if the message is a direct reply to the bot's number (DM)
     # The WhatsApp API often sends messages from a group as if they were from the user
     # to the bot's number. For simplicity, we'll assume any non-command message
     # is a candidate for an AI reply, as per the user's request.
     
-    reply = get_humorous_reply(message_text)
-    send_whatsapp_message(sender_id, reply)
+    # Cloud API deliveries carry no group id, so each sender's thread is its own chat.
+    reply = await get_humorous_reply_async(message_text, chat_id=sender_id)
+    await send_whatsapp_message(sender_id, reply)
+
+def format_receipt_summary(summary: dict) -> str:
+    return (
+        f"• *{summary['tag']}*: {summary['total']} sent, {summary['delivered']} delivered, "
+        f"{summary['read']} read ({summary['read_rate']:.0%}), {summary['failed']} failed"
+    )
+
+async def run_broadcast(admin_id: str, target: str, recipients: list, announcement_text: str):
+    """Fans an announcement out to `recipients`, reporting progress and the final tally to the admin."""
+    async def report_progress(result: dict):
+        await send_whatsapp_message(
+            admin_id,
+            f"⏳ Broadcast to *{target}*: {result['sent']} sent, {result['failed']} failed, {result['pending']} pending."
+        )
+
+    result = await broadcaster.broadcast(recipients, announcement_text, on_progress=report_progress)
+    await send_whatsapp_message(
+        admin_id,
+        f"✅ *Broadcast complete* ({target})\n\n"
+        f"Sent: {result['sent']}\nFailed: {result['failed']}\nRetrying later: {result['deferred']}\n"
+        f"Took {result['seconds']}s. Read receipts: `/receipts {result['id']}`"
+    )
+
+async def process_message(message: "Message"):
+    """Dispatches a single incoming message. Runs on a work queue worker, not in the request."""
+    sender_id = message.sender_id
+    message_type = message.type
+
+    if message_type == "text":
+        message_text = message.text_body
+        # Message text is not logged: it is user content and unbounded in size.
+        logger.info(f"Received text message from {sender_id} ({len(message_text)} chars).", extra={"category": "inbound"})
+
+        started = time.perf_counter()
+        if message_text.startswith("/"):
+            # It's a command
+            await handle_command(sender_id, message_text)
+            command = message_text.split(maxsplit=1)[0].lower()
+            handler = command if command in GENERAL_COMMANDS or command in ADMIN_COMMANDS else "unknown"
+        else:
+            # It's a normal chat message
+            await handle_ai_reply(sender_id, message_text)
+            handler = "ai_reply"
+        DISPATCH_SECONDS.labels(handler).observe(time.perf_counter() - started)
+
+    elif message_type in ["image", "video", "audio", "sticker"]:
+        # Handle media messages if needed, for now, just acknowledge
+        logger.info(f"Received media message ({message_type}) from {sender_id}", extra={"category": "inbound"})
+        # await send_whatsapp_message(sender_id, f"Thanks for the {message_type}! I'm focusing on text commands for now.")
+
+    else:
+        logger.warning(f"Unhandled message type: {message_type}")
+
+def rate_limit_category(message: "Message"):
+    """Returns the rate limit budget a message draws from, or None if it triggers no expensive work."""
+    if message.type != "text":
+        return None
+    message_text = message.text_body
+    if not message_text.startswith("/"):
+        return "ai"
+    command = message_text.split(maxsplit=1)[0].lower()
+    return "admin" if command in ADMIN_COMMANDS else "command"
+
+async def send_throttle_notice(sender_id: str):
+    """Tells a throttled sender once that their messages are being dropped."""
+    await send_whatsapp_message(sender_id, "⏳ *Slow down a bit!* You're sending messages faster than I can keep up. Please try again in a minute.")
+
 
 
 # --- WhatsApp Webhook Schema ---
-# This is a simplified model to parse the incoming message event
+# This is a simplified model to parse the incoming message event.
+# Only deliveries that contain messages are validated; receipts stay raw dicts.
+class TextContent(BaseModel):
+    body: str = ""
+
+class Message(BaseModel):
+    model_config = ConfigDict(extra="allow", populate_by_name=True)
+
+    id: str | None = None
+    sender_id: str | None = Field(None, alias="from")
+    type: str | None = None
+    timestamp: str | None = None
+    text: TextContent | None = None
+
+    @property
+    def text_body(self) -> str:
+        return self.text.body.strip() if self.text else ""
+
 class ChangeValue(BaseModel):
     messaging_product: str
     metadata: dict
     statuses: list = []
-    messages: list = []
+    messages: list[Message] = []
 
 class Change(BaseModel):
     value: ChangeValue
@@ -246,16 +500,74 @@ class WebhookPayload(BaseModel):
 
 @app.get("/health", status_code=status.HTTP_200_OK)
 async def health_check():
-    """Simple health check endpoint, includes active reminders."""
-    active_reminders = get_active_reminders()
+    """Simple health check endpoint, includes reminder counts and runtime stats for each subsystem."""
     return {
         "status": "ok", 
         "message": "WhatsApp HOC Bot is running.",
-        "active_reminders": active_reminders
+        "reminders": get_reminder_counts(),
+        "scheduler": get_scheduler_stats(),
+        "work_queue": work_queue.stats(),
+        "dedup": seen_messages.stats(),
+        "reservoirs": {"joke": joke_reservoir.stats(), "quote": quote_reservoir.stats()},
+        "reply_cache": reply_cache.stats(),
+        "ai": ai_stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "broadcasts": broadcaster.stats(),
+        "receipts": {**receipt_sink.stats(), "store": receipt_store.stats()},
+        "outbox": {**outbox.stats(), "pending": await asyncio.to_thread(outbox.pending_count)},
+        "logging": logging_stats()
     }
-async def health_check():
-    """Simple health check endpoint."""
-    return {"status": "ok", "message": "WhatsApp HOC Bot is running."}
+
+def check_admin_token(authorization: str = None):
+    """
+    Rejects admin API calls without the ADMIN_API_TOKEN bearer token. The admin endpoints
+    expose reminder texts, message bodies and phone numbers, so they are off (404) when no
+    token is configured.
+    """
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not secrets.compare_digest((authorization or "").encode(), f"Bearer {ADMIN_API_TOKEN}".encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin token")
+
+@app.get("/reminders")
+async def get_reminders(
+    sender_id: str = None,
+    after: float = Query(None, description="Only reminders firing at or after this epoch time"),
+    before: float = Query(None, description="Only reminders firing before this epoch time"),
+    cursor: str = None,
+    limit: int = Query(50, ge=1, le=500),
+    authorization: str = Header(None)
+):
+    """Paginated list of stored reminders, earliest first. Pass `next_cursor` back as `cursor` for the next page."""
+    check_admin_token(authorization)
+    try:
+        return list_reminders(sender_id=sender_id, after=after, before=before, cursor=cursor, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+@app.get("/metrics")
+async def metrics(authorization: str = Header(None)):
+    """Prometheus metrics in the text exposition format."""
+    check_admin_token(authorization)
+    # Some gauges read SQLite, so render off the event loop.
+    return Response(content=await asyncio.to_thread(REGISTRY.render), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/receipts")
+async def get_receipts(
+    tag: str = Query(None, description="Exact tag, e.g. broadcast:<id> or reminders"),
+    prefix: str = Query(None, description="Tag prefix, e.g. broadcast:"),
+    limit: int = Query(20, ge=1, le=200),
+    authorization: str = Header(None)
+):
+    """Delivery/read summaries of tracked broadcasts and reminders, most recent first."""
+    check_admin_token(authorization)
+    return {"items": receipt_store.summaries(tag=tag, prefix=prefix, limit=limit)}
+
+@app.get("/outbox/dead_letters")
+async def get_dead_letters(limit: int = Query(50, ge=1, le=500), authorization: str = Header(None)):
+    """Most recent outbound messages that failed permanently or ran out of retries."""
+    check_admin_token(authorization)
+    return {"items": outbox.dead_letters(limit=limit)}
 
 @app.get("/webhook")
 async def verify_webhook(request: Request):
@@ -278,49 +590,83 @@ async def verify_webhook(request: Request):
 
 
 @app.post("/webhook")
-async def handle_webhook(payload: WebhookPayload):
-    """Endpoint to receive incoming WhatsApp messages."""
-    
+async def handle_webhook(request: Request):
+    """
+    Endpoint to receive incoming WhatsApp messages.
+    Only validates and enqueues; commands and AI replies run on the work queue workers.
+
+    The raw body is decoded once and classified with plain dict lookups. Receipts
+    (most of the traffic) go straight to the receipt sink; only deliveries that
+    contain messages are validated into the typed webhook models.
+    """
+    started = time.perf_counter()
+    kind = "invalid"
     try:
-        # Iterate over entries and changes to find the message
-        for entry in payload.entry:
-            for change in entry.changes:
-                if change.field == "messages":
-                    # Check for incoming messages
-                    if change.value.messages:
-                        message_data = change.value.messages[0]
-                        sender_id = message_data.get("from")
-                        message_type = message_data.get("type")
-                        
-                        if message_type == "text":
-                            message_text = message_data.get("text", {}).get("body", "").strip()
-                            logger.info(f"Received text message from {sender_id}: {message_text}")
-                            
-                            if message_text.startswith("/"):
-                                # It's a command
-                                handle_command(sender_id, message_text)
-                            else:
-                                # It's a normal chat message
-                                handle_ai_reply(sender_id, message_text)
-                                
-                        elif message_type in ["image", "video", "audio", "sticker"]:
-                            # Handle media messages if needed, for now, just acknowledge
-                            logger.info(f"Received media message ({message_type}) from {sender_id}")
-                            # send_whatsapp_message(sender_id, f"Thanks for the {message_type}! I'm focusing on text commands for now.")
-                            
-                        else:
-                            logger.warning(f"Unhandled message type: {message_type}")
-                            
-                    # Check for status updates (e.g., message delivered, read)
-                    if change.value.statuses:
-                        status_data = change.value.statuses[0]
-                        logger.info(f"Status update: ID {status_data.get('id')}, Status: {status_data.get('status')}")
-
-    except Exception as e:
-        logger.error(f"Error processing webhook payload: {e}")
-        # Return 200 OK even on error to prevent Meta from retrying indefinitely
-        
-    return {"status": "ok"}
+        try:
+            raw_payload = webhook_parser.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON body")
+
+        has_messages, statuses = webhook_parser.split_events(raw_payload)
+        # Status updates (e.g., message delivered, read)
+        if statuses:
+            receipt_sink.add(statuses)
+        if not has_messages:
+            kind = "receipts"
+            return {"status": "ok"}
+        kind = "messages"
+
+        try:
+            payload = WebhookPayload.model_validate(raw_payload)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+
+        rejected = False
+        try:
+            # Meta batches several events into one delivery: walk every entry, change
+            # and message. The work queue keeps each sender's messages in order
+            # while different senders are processed concurrently.
+            for entry in payload.entry:
+                for change in entry.changes:
+                    if change.field != "messages":
+                        continue
+
+                    # Incoming messages
+                    for message in change.value.messages:
+                        sender_id = message.sender_id
+                        if not sender_id:
+                            logger.warning(f"Skipping message without sender: ID {message.id}")
+                            continue
+                        message_id = message.id
+                        if message_id and seen_messages.check_and_add(message_id):
+                            logger.info(f"Dropping redelivered message {message_id} from {sender_id}", extra={"category": "inbound"})
+                            continue
+
+                        category = rate_limit_category(message)
+                        if category:
+                            decision = rate_limiter.check(sender_id, category)
+                            if decision != ALLOW:
+                                if decision == THROTTLE_NOTIFY:
+                                    await work_queue.submit(sender_id, send_throttle_notice, sender_id)
+                                continue
+
+                        if not await work_queue.submit(sender_id, process_message, message):
+                            rejected = True
+                            if message_id:
+                                # Let Meta's redelivery through once we have capacity again.
+                                seen_messages.discard(message_id)
+
+        except Exception as e:
+            logger.error(f"Error processing webhook payload: {e}")
+            # Return 200 OK even on error to prevent Meta from retrying indefinitely
+
+        if rejected:
+            # Overloaded: ask Meta to redeliver later instead of silently dropping the message.
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Message queue is full")
+
+        return {"status": "ok"}
+    finally:
+        WEBHOOK_SECONDS.labels(kind).observe(time.perf_counter() - started)
 
 
 # --- Entry Point for Local Development ---
@@ -1,8 +1,16 @@
 import os
+import json
 import random
+import asyncio
 import logging
-from openai import OpenAI
-from openai.error import OpenAIError
+import time
+import threading
+from .metrics import REGISTRY
+from .circuit_breaker import CircuitBreaker
+from .reservoir import ContentReservoir
+from .reply_cache import ReplyCache
+from .reply_batcher import ReplyBatcher
+from .conversation_memory import ConversationMemory
 
 logger = logging.getLogger(__name__)
 
@@ -24,96 +32,458 @@ FALLBACK_QUOTES = [
     "The mind is not a vessel to be filled but a fire to be kindled. - Plutarch",
 ]
 
+# --- Reservoir Configuration ---
+# /joke and /quote are served from pools of pre-generated items refilled in the background.
+RESERVOIR_CAPACITY = int(os.getenv("RESERVOIR_CAPACITY", "20"))
+RESERVOIR_LOW_WATER = int(os.getenv("RESERVOIR_LOW_WATER", "5"))
+RESERVOIR_BATCH_SIZE = int(os.getenv("RESERVOIR_BATCH_SIZE", "10"))
+RESERVOIR_RECENT_WINDOW = int(os.getenv("RESERVOIR_RECENT_WINDOW", "50"))
+
+# --- Reply Cache Configuration ---
+# Repeated small talk ("lol", "when is the test") is answered from cached AI replies.
+REPLY_CACHE_ENABLED = os.getenv("REPLY_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+REPLY_CACHE_MAX_KEYS = int(os.getenv("REPLY_CACHE_MAX_KEYS", "2000"))
+REPLY_CACHE_TTL_SECONDS = float(os.getenv("REPLY_CACHE_TTL_SECONDS", "3600"))
+REPLY_CACHE_VARIANTS = int(os.getenv("REPLY_CACHE_VARIANTS", "3"))
+
+# --- Reply Batching Configuration ---
+# Optionally answer bursts of chat messages with one completion instead of one call each.
+AI_BATCH_ENABLED = os.getenv("AI_BATCH_ENABLED", "false").lower() in ("1", "true", "yes")
+AI_BATCH_WINDOW_MS = float(os.getenv("AI_BATCH_WINDOW_MS", "30"))
+AI_BATCH_MAX_SIZE = int(os.getenv("AI_BATCH_MAX_SIZE", "8"))
+
+# --- Conversation Memory Configuration ---
+# Chat replies see the chat's recent turns, trimmed to AI_HISTORY_TOKEN_BUDGET so cost stays flat.
+CHAT_MEMORY_ENABLED = os.getenv("CHAT_MEMORY_ENABLED", "true").lower() in ("1", "true", "yes")
+CHAT_MEMORY_TURNS = int(os.getenv("CHAT_MEMORY_TURNS", "10"))
+CHAT_MEMORY_MAX_CHARS = int(os.getenv("CHAT_MEMORY_MAX_CHARS", "500"))
+CHAT_MEMORY_MAX_CHATS = int(os.getenv("CHAT_MEMORY_MAX_CHATS", "5000"))
+CHAT_MEMORY_IDLE_SECONDS = float(os.getenv("CHAT_MEMORY_IDLE_SECONDS", "21600"))
+AI_HISTORY_TOKEN_BUDGET = int(os.getenv("AI_HISTORY_TOKEN_BUDGET", "400"))
+
+# --- Resilience Configuration ---
+AI_MODEL = os.getenv("AI_MODEL", "gpt-4.1-mini")  # Using a fast, capable model
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", "10"))
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+AI_BREAKER_FAILURE_THRESHOLD = int(os.getenv("AI_BREAKER_FAILURE_THRESHOLD", "5"))
+AI_BREAKER_RECOVERY_SECONDS = float(os.getenv("AI_BREAKER_RECOVERY_SECONDS", "30"))
+
+# Replies returned by get_ai_response when no real completion is available.
+AI_OFFLINE_REPLY = "Sorry, my AI brain is currently offline. Try again later! 🤖"
+AI_ERROR_REPLY = "Oops! I hit a snag while talking to the AI cloud. Maybe try asking me for a `/joke` instead? 😅"
+AI_UNEXPECTED_REPLY = "My circuits are buzzing! I need a moment. 😵‍💫"
+AI_FALLBACK_REPLIES = (AI_OFFLINE_REPLY, AI_ERROR_REPLY, AI_UNEXPECTED_REPLY)
+
+# --- Metrics ---
+OPENAI_SECONDS = REGISTRY.histogram("whatsapp_openai_request_seconds", "OpenAI completion latency.", ("mode", "outcome"))
+OPENAI_TOKENS = REGISTRY.counter("whatsapp_openai_tokens", "OpenAI tokens used.", ("kind",))
+# result is "ok" or why a fallback was returned: offline, breaker_open, no_slot, timeout, api_error, unexpected
+AI_RESPONSES = REGISTRY.counter("whatsapp_ai_responses", "get_ai_response results.", ("result",))
+# source is "ai", "cache" or "fallback"
+AI_REPLIES = REGISTRY.counter("whatsapp_ai_replies", "Chat replies by where they came from.", ("source",))
+
 # --- AI Client Initialization ---
-# The OpenAI client will automatically pick up the OPENAI_API_KEY from the environment
-try:
-    client = OpenAI()
-except Exception as e:
-    logger.warning(f"Failed to initialize OpenAI client: {e}. AI functions will use fallbacks.")
-    client = None
+# The openai package is large (~0.5s to import), so it is imported and the clients are
+# created on first use rather than at import time. The clients pick up OPENAI_API_KEY
+# from the environment. Retries are disabled so AI_TIMEOUT_SECONDS is a real per-call deadline.
+_client = None
+_async_client = None
+_clients_initialized = False
+_client_lock = threading.Lock()
+
+def _init_clients():
+    global _client, _async_client, _clients_initialized
+    with _client_lock:
+        if _clients_initialized:
+            return
+        try:
+            from openai import OpenAI, AsyncOpenAI
+            _client = OpenAI(timeout=AI_TIMEOUT_SECONDS, max_retries=0)
+            _async_client = AsyncOpenAI(timeout=AI_TIMEOUT_SECONDS, max_retries=0)
+        except Exception as e:
+            logger.warning(f"Failed to initialize OpenAI client: {e}. AI functions will use fallbacks.")
+            _client = None
+            _async_client = None
+        _clients_initialized = True
+
+def get_client():
+    """Returns the shared OpenAI client, creating it on first use (None if it can't be created)."""
+    if not _clients_initialized:
+        _init_clients()
+    return _client
+
+def get_async_client():
+    """Returns the shared AsyncOpenAI client, creating it on first use (None if it can't be created)."""
+    if not _clients_initialized:
+        _init_clients()
+    return _async_client
+
+async def close_clients():
+    """Closes the OpenAI clients' connection pools, if they were ever created (app shutdown)."""
+    global _client, _async_client, _clients_initialized
+    with _client_lock:
+        client, async_client = _client, _async_client
+        _client = _async_client = None
+        _clients_initialized = False
+    if async_client is not None:
+        await async_client.close()
+    if client is not None:
+        client.close()
+
+# Shared by the sync and async paths: when OpenAI keeps failing, skip straight to fallbacks.
+ai_breaker = CircuitBreaker(
+    "openai",
+    failure_threshold=AI_BREAKER_FAILURE_THRESHOLD,
+    recovery_timeout=AI_BREAKER_RECOVERY_SECONDS
+)
+# Caps parallel completions from the async path; callers wait at most AI_TIMEOUT_SECONDS for a slot.
+_ai_semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+_ai_in_flight = 0
+_ai_concurrency_rejected = 0
 
 # --- AI Functions ---
 
-def get_ai_response(prompt: str, system_prompt: str, temperature: float = 0.7) -> str:
+def is_fallback_reply(reply: str) -> bool:
+    """True if `reply` is one of get_ai_response's canned failure replies rather than a completion."""
+    return reply in AI_FALLBACK_REPLIES
+
+def _record_completion(mode: str, started: float, response):
+    OPENAI_SECONDS.labels(mode, "ok").observe(time.perf_counter() - started)
+    AI_RESPONSES.labels("ok").inc()
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        OPENAI_TOKENS.labels("prompt").inc(usage.prompt_tokens or 0)
+        OPENAI_TOKENS.labels("completion").inc(usage.completion_tokens or 0)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token plus per-message overhead); no tokenizer needed."""
+    return len(text) // 4 + 4
+
+def trim_history(history: list, budget: int = AI_HISTORY_TOKEN_BUDGET) -> list:
+    """Returns the newest (role, content) turns of `history` that fit in `budget` tokens, oldest first."""
+    kept, used = [], 0
+    for role, content in reversed(history or ()):
+        used += estimate_tokens(content)
+        if used > budget:
+            break
+        kept.append((role, content))
+    kept.reverse()
+    return kept
+
+def _build_messages(prompt: str, system_prompt: str, history: list = None,
+                    history_budget: int = AI_HISTORY_TOKEN_BUDGET) -> list:
+    """
+    Builds the chat messages for a completion. `history` is (role, content) pairs, oldest first;
+    the newest turns that fit in `history_budget` tokens are kept and older ones are dropped.
+    """
+    kept = [{"role": role, "content": content} for role, content in trim_history(history, history_budget)]
+    return [{"role": "system", "content": system_prompt}, *kept, {"role": "user", "content": prompt}]
+
+def get_ai_response(prompt: str, system_prompt: str, temperature: float = 0.7, max_tokens: int = 150,
+                    history: list = None) -> str:
     """
     Generates a response using the OpenAI API.
-    Uses a fallback if the client is not initialized or the API call fails.
+    Uses a fallback if the client is not initialized, the circuit breaker is open or the API call fails.
+    `history` is optional earlier (role, content) turns, trimmed to AI_HISTORY_TOKEN_BUDGET.
     """
+    client = get_client()
     if not client:
         logger.warning("OpenAI client not available. Returning a generic fallback response.")
-        return "Sorry, my AI brain is currently offline. Try again later! 🤖"
+        AI_RESPONSES.labels("offline").inc()
+        return AI_OFFLINE_REPLY
+
+    if not ai_breaker.allow():
+        AI_RESPONSES.labels("breaker_open").inc()
+        return AI_ERROR_REPLY
 
+    started = time.perf_counter()
     try:
         response = client.chat.completions.create(
-            model="gpt-4.1-mini", # Using a fast, capable model
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
+            model=AI_MODEL,
+            messages=_build_messages(prompt, system_prompt, history),
             temperature=temperature,
-            max_tokens=150
+            max_tokens=max_tokens
         )
+        ai_breaker.record_success()
+        _record_completion("sync", started, response)
         return response.choices[0].message.content.strip()
-    except OpenAIError as e:
+    except Exception as e:
+        return _handle_ai_error(e, "sync", started)
+
+def _handle_ai_error(e: Exception, mode: str, started: float) -> str:
+    # The client exists, so openai is already imported and this import is a cache lookup.
+    from openai import OpenAIError
+    ai_breaker.record_failure()
+    OPENAI_SECONDS.labels(mode, "error").observe(time.perf_counter() - started)
+    if isinstance(e, OpenAIError):
+        AI_RESPONSES.labels("api_error").inc()
         logger.error(f"OpenAI API Error: {e}. Falling back to a generic response.")
-        return "Oops! I hit a snag while talking to the AI cloud. Maybe try asking me for a `/joke` instead? 😅"
+        return AI_ERROR_REPLY
+    AI_RESPONSES.labels("unexpected").inc()
+    logger.error(f"An unexpected error occurred during AI generation: {e}")
+    return AI_UNEXPECTED_REPLY
+
+async def get_ai_response_async(prompt: str, system_prompt: str, temperature: float = 0.7, max_tokens: int = 150,
+                                history: list = None) -> str:
+    """
+    Async variant of get_ai_response for the event loop.
+    Waits at most AI_TIMEOUT_SECONDS for a concurrency slot and AI_TIMEOUT_SECONDS for the completion,
+    and returns a fallback immediately while the circuit breaker is open.
+    """
+    global _ai_in_flight, _ai_concurrency_rejected
+
+    async_client = get_async_client()
+    if not async_client:
+        logger.warning("OpenAI client not available. Returning a generic fallback response.")
+        AI_RESPONSES.labels("offline").inc()
+        return AI_OFFLINE_REPLY
+
+    if not ai_breaker.allow():
+        AI_RESPONSES.labels("breaker_open").inc()
+        return AI_ERROR_REPLY
+
+    try:
+        await asyncio.wait_for(_ai_semaphore.acquire(), timeout=AI_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        _ai_concurrency_rejected += 1
+        AI_RESPONSES.labels("no_slot").inc()
+        logger.warning(f"No free OpenAI slot within {AI_TIMEOUT_SECONDS}s ({AI_MAX_CONCURRENCY} in flight).")
+        return AI_ERROR_REPLY
+
+    _ai_in_flight += 1
+    started = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(
+            async_client.chat.completions.create(
+                model=AI_MODEL,
+                messages=_build_messages(prompt, system_prompt, history),
+                temperature=temperature,
+                max_tokens=max_tokens
+            ),
+            timeout=AI_TIMEOUT_SECONDS
+        )
+        ai_breaker.record_success()
+        _record_completion("async", started, response)
+        return response.choices[0].message.content.strip()
+    except asyncio.TimeoutError:
+        ai_breaker.record_failure()
+        OPENAI_SECONDS.labels("async", "timeout").observe(time.perf_counter() - started)
+        AI_RESPONSES.labels("timeout").inc()
+        logger.error(f"OpenAI call exceeded {AI_TIMEOUT_SECONDS}s. Falling back to a generic response.")
+        return AI_ERROR_REPLY
     except Exception as e:
-        logger.error(f"An unexpected error occurred during AI generation: {e}")
-        return "My circuits are buzzing! I need a moment. 😵‍💫"
+        return _handle_ai_error(e, "async", started)
+    finally:
+        _ai_in_flight -= 1
+        _ai_semaphore.release()
 
-def get_joke() -> str:
-    """Gets a student-friendly joke, using AI or a fallback list."""
+def ai_stats() -> dict:
+    """Returns circuit breaker state, concurrency limiter and batching counters."""
+    return {
+        "breaker": ai_breaker.stats(),
+        "in_flight": _ai_in_flight,
+        "max_concurrency": AI_MAX_CONCURRENCY,
+        "concurrency_rejected": _ai_concurrency_rejected,
+        "batching": reply_batcher.stats() if reply_batcher is not None else None,
+        "chat_memory": chat_memory.stats(),
+    }
+
+def _parse_json_list(text: str) -> list:
+    """Extracts a list of non-empty strings from a JSON array reply, tolerating code fences."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("["):]
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end == -1:
+        return []
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return []
+    return [item.strip() for item in items if isinstance(item, str) and item.strip()]
+
+def generate_jokes(count: int) -> list:
+    """Generates a batch of distinct student-friendly jokes in a single completion."""
     system_prompt = (
-        "You are a witty, student-friendly AI bot. Generate a single, clean, "
-        "humorous joke related to university, class, or student life. "
-        "Keep it short and use emojis."
+        "You are a witty, student-friendly AI bot. Generate clean, humorous jokes "
+        "related to university, class, or student life. Keep each one short and use emojis. "
+        "Respond with only a JSON array of strings, one joke per string."
     )
-    prompt = "Tell me a funny student-related joke."
-    
-    try:
-        joke = get_ai_response(prompt, system_prompt, temperature=0.8)
-        if "Sorry, my AI brain is currently offline" in joke or "Oops! I hit a snag" in joke:
-            raise Exception("AI failed, use fallback.")
-        return joke
-    except:
-        return random.choice(FALLBACK_JOKES)
+    prompt = f"Give me {count} different funny student-related jokes."
+    return _parse_json_list(get_ai_response(prompt, system_prompt, temperature=0.8, max_tokens=80 * count))
 
-def get_quote() -> str:
-    """Gets a motivational quote, using AI or a fallback list."""
+def generate_quotes(count: int) -> list:
+    """Generates a batch of distinct motivational quotes in a single completion."""
     system_prompt = (
-        "You are a motivational AI bot. Provide a single, concise, and inspiring "
-        "quote suitable for a student. Attribute the quote."
+        "You are a motivational AI bot. Provide concise and inspiring quotes suitable "
+        "for a student. Attribute each quote. "
+        "Respond with only a JSON array of strings, one quote per string."
     )
-    prompt = "Give me a motivational quote."
-    
-    try:
-        quote = get_ai_response(prompt, system_prompt, temperature=0.6)
-        if "Sorry, my AI brain is currently offline" in quote or "Oops! I hit a snag" in quote:
-            raise Exception("AI failed, use fallback.")
-        return quote
-    except:
-        return random.choice(FALLBACK_QUOTES)
-
-def get_humorous_reply(user_message: str) -> str:
-    """Generates a humorous, casual, and student-friendly reply to a non-command message."""
+    prompt = f"Give me {count} different motivational quotes."
+    return _parse_json_list(get_ai_response(prompt, system_prompt, temperature=0.6, max_tokens=60 * count))
+
+joke_reservoir = ContentReservoir(
+    "joke", generate_jokes, FALLBACK_JOKES,
+    capacity=RESERVOIR_CAPACITY, low_water=RESERVOIR_LOW_WATER,
+    batch_size=RESERVOIR_BATCH_SIZE, recent_window=RESERVOIR_RECENT_WINDOW
+)
+
+quote_reservoir = ContentReservoir(
+    "quote", generate_quotes, FALLBACK_QUOTES,
+    capacity=RESERVOIR_CAPACITY, low_water=RESERVOIR_LOW_WATER,
+    batch_size=RESERVOIR_BATCH_SIZE, recent_window=RESERVOIR_RECENT_WINDOW
+)
+
+def warm_reservoirs():
+    """Creates the OpenAI clients and starts refilling the joke and quote pools, all off the caller's thread."""
+    def warm():
+        if get_client():
+            joke_reservoir.refill()
+            quote_reservoir.refill()
+    threading.Thread(target=warm, name="ai-warmup", daemon=True).start()
+
+def get_joke() -> str:
+    """Gets a student-friendly joke from the pre-generated pool, or a fallback if it is empty."""
+    return joke_reservoir.pop()
+
+def get_quote() -> str:
+    """Gets a motivational quote from the pre-generated pool, or a fallback if it is empty."""
+    return quote_reservoir.pop()
+
+reply_cache = ReplyCache(
+    enabled=REPLY_CACHE_ENABLED,
+    max_keys=REPLY_CACHE_MAX_KEYS,
+    ttl_seconds=REPLY_CACHE_TTL_SECONDS,
+    variants=REPLY_CACHE_VARIANTS
+)
+
+chat_memory = ConversationMemory(
+    enabled=CHAT_MEMORY_ENABLED,
+    max_turns=CHAT_MEMORY_TURNS,
+    max_chars=CHAT_MEMORY_MAX_CHARS,
+    max_chats=CHAT_MEMORY_MAX_CHATS,
+    idle_seconds=CHAT_MEMORY_IDLE_SECONDS
+)
+
+HUMOROUS_REPLY_SYSTEM_PROMPT = (
+    "You are a casual, friendly, and slightly witty student-focused AI bot. "
+    "Your goal is to respond to the user's message in a natural, empathetic, "
+    "and humorous way, relating it to university or class life. Keep the reply "
+    "short (1-2 sentences) and use relevant emojis. Do not use markdown formatting."
+)
+
+# Generic humorous fallbacks for chat
+FALLBACK_REPLIES = [
+    "😂 I feel you, that lecturer’s 8AM class is built different!",
+    "Hang in there 😭, exams don’t kill — they just reduce WiFi strength!",
+    "We're all in this together! Maybe a quick nap will fix it? 😴",
+    "Don't worry, the weekend is only a few hundred slides away! 😉"
+]
+
+def _reply_prompt(user_message: str) -> str:
+    return f"User said: '{user_message}'"
+
+def _prompt_history(history: list) -> list:
+    """Remembered (role, text) turns in the same shape as the live prompt."""
+    return [(role, _reply_prompt(text) if role == "user" else text) for role, text in history or ()]
+
+async def _complete_single_reply(user_message: str, history: list = None) -> str:
+    return await get_ai_response_async(
+        _reply_prompt(user_message), HUMOROUS_REPLY_SYSTEM_PROMPT, temperature=0.9,
+        history=_prompt_history(history)
+    )
+
+async def _complete_reply_batch(user_messages: list, histories: list):
+    """
+    Answers several chat messages with one completion that returns a JSON array of replies.
+    Each message carries its own chat's recent turns, trimmed to AI_HISTORY_TOKEN_BUDGET.
+    Returns None if the output can't be matched up with the messages.
+    """
     system_prompt = (
-        "You are a casual, friendly, and slightly witty student-focused AI bot. "
-        "Your goal is to respond to the user's message in a natural, empathetic, "
-        "and humorous way, relating it to university or class life. Keep the reply "
-        "short (1-2 sentences) and use relevant emojis. Do not use markdown formatting."
+        f"{HUMOROUS_REPLY_SYSTEM_PROMPT} You will receive a JSON array of {len(user_messages)} "
+        "items, each a new `message` from a different user, optionally with that user's earlier "
+        "`conversation` with you (oldest first) for context. Reply to each message independently. "
+        f"Respond with only a JSON array of exactly {len(user_messages)} reply strings, in the same order."
     )
-    prompt = f"User said: '{user_message}'"
-    
-    try:
-        reply = get_ai_response(prompt, system_prompt, temperature=0.9)
-        if "Sorry, my AI brain is currently offline" in reply or "Oops! I hit a snag" in reply:
-            raise Exception("AI failed, use fallback.")
-        return reply
-    except:
-        # Generic humorous fallback for chat
-        return random.choice([
-            "😂 I feel you, that lecturer’s 8AM class is built different!",
-            "Hang in there 😭, exams don’t kill — they just reduce WiFi strength!",
-            "We're all in this together! Maybe a quick nap will fix it? 😴",
-            "Don't worry, the weekend is only a few hundred slides away! 😉"
-        ])
+    items = []
+    for user_message, history in zip(user_messages, histories):
+        item = {"message": user_message}
+        turns = trim_history(history)
+        if turns:
+            item["conversation"] = [{"role": role, "text": text} for role, text in turns]
+        items.append(item)
+    prompt = json.dumps(items, ensure_ascii=False)
+    reply = await get_ai_response_async(prompt, system_prompt, temperature=0.9, max_tokens=80 * len(user_messages))
+    if is_fallback_reply(reply):
+        # The AI itself failed; every caller gets the fallback instead of a retry storm.
+        return [reply] * len(user_messages)
+    replies = _parse_json_list(reply)
+    return replies if len(replies) == len(user_messages) else None
+
+reply_batcher = ReplyBatcher(
+    _complete_reply_batch,
+    _complete_single_reply,
+    window_ms=AI_BATCH_WINDOW_MS,
+    max_batch_size=AI_BATCH_MAX_SIZE
+) if AI_BATCH_ENABLED else None
+
+def _remember(chat_id: str, user_message: str, reply: str = None):
+    if chat_id:
+        chat_memory.add(chat_id, "user", user_message)
+        if reply is not None:
+            chat_memory.add(chat_id, "assistant", reply)
+
+def _cached_reply(chat_id: str, user_message: str, history: list = None):
+    if history:
+        # A reply built from one chat's context must not answer another chat's message.
+        return None
+    cached = reply_cache.get(user_message)
+    if cached:
+        AI_REPLIES.labels("cache").inc()
+        _remember(chat_id, user_message, cached)
+    return cached
+
+def _finish_humorous_reply(user_message: str, reply: str, chat_id: str = None, history: list = None) -> str:
+    if is_fallback_reply(reply):
+        AI_REPLIES.labels("fallback").inc()
+        # Canned fallbacks are not remembered as the bot's side of the conversation.
+        _remember(chat_id, user_message)
+        return random.choice(FALLBACK_REPLIES)
+    AI_REPLIES.labels("ai").inc()
+    # Only real, context-free AI replies are cached; fallbacks would otherwise stick for
+    # the whole TTL, and history-based replies would leak into other chats.
+    if not history:
+        reply_cache.add(user_message, reply)
+    _remember(chat_id, user_message, reply)
+    return reply
+
+def get_humorous_reply(user_message: str, chat_id: str = None) -> str:
+    """
+    Generates a humorous, casual, and student-friendly reply to a non-command message.
+    With a `chat_id`, the chat's recent turns are sent as context and the exchange is remembered.
+    """
+    history = chat_memory.history(chat_id) if chat_id else None
+    cached = _cached_reply(chat_id, user_message, history)
+    if cached:
+        return cached
+
+    reply = get_ai_response(
+        _reply_prompt(user_message), HUMOROUS_REPLY_SYSTEM_PROMPT, temperature=0.9,
+        history=_prompt_history(history)
+    )
+    return _finish_humorous_reply(user_message, reply, chat_id, history)
+
+async def get_humorous_reply_async(user_message: str, chat_id: str = None) -> str:
+    """Async variant of get_humorous_reply, bounded by the AI deadline, concurrency limit and circuit breaker."""
+    history = chat_memory.history(chat_id) if chat_id else None
+    cached = _cached_reply(chat_id, user_message, history)
+    if cached:
+        return cached
+
+    if reply_batcher is not None:
+        # Each batched message carries its own chat's history, so chats with context batch too.
+        reply = await reply_batcher.submit(user_message, history)
+    else:
+        reply = await _complete_single_reply(user_message, history)
+    return _finish_humorous_reply(user_message, reply, chat_id, history)
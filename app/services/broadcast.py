@@ -0,0 +1,246 @@
+import time
+import uuid
+import random
+import asyncio
+import logging
+import threading
+from .db import LazyConnection
+from .whatsapp_client import WhatsAppSendError
+
+logger = logging.getLogger(__name__)
+
+# Alias that targets every registered recipient.
+ALL_TARGETS = "all"
+
+
+class TargetRegistry:
+    """
+    Named broadcast targets (class groups, DM lists): alias -> set of WhatsApp recipient ids.
+    Every call reads the SQLite table (it is small and indexed by alias), so groups registered
+    by another worker process sharing the file are visible immediately.
+    """
+
+    def __init__(self, db_path: str):
+        self._db = LazyConnection(db_path, (
+            "CREATE TABLE IF NOT EXISTS broadcast_targets ("
+            " alias TEXT NOT NULL,"
+            " recipient_id TEXT NOT NULL,"
+            " PRIMARY KEY (alias, recipient_id))",
+        ))
+        self._lock = threading.Lock()
+
+    @property
+    def _conn(self):
+        return self._db.get()
+
+    @staticmethod
+    def normalize_alias(alias: str) -> str:
+        # "@cs101" and "cs101" name the same group; the "@" is how /announce marks a target.
+        return alias.strip().lstrip("@").lower()
+
+    def add(self, alias: str, recipient_ids: list) -> int:
+        """Adds recipients to `alias`, creating it if needed. Returns how many were new."""
+        alias = self.normalize_alias(alias)
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO broadcast_targets (alias, recipient_id) VALUES (?, ?)",
+                [(alias, r) for r in dict.fromkeys(recipient_ids)]
+            )
+            return self._conn.total_changes - before
+
+    def remove(self, alias: str, recipient_ids: list = None) -> int:
+        """Removes the given recipients from `alias` (or the whole alias). Returns how many were removed."""
+        alias = self.normalize_alias(alias)
+        with self._lock:
+            if recipient_ids:
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "DELETE FROM broadcast_targets WHERE alias = ? AND recipient_id = ?",
+                    [(alias, r) for r in dict.fromkeys(recipient_ids)]
+                )
+                return self._conn.total_changes - before
+            return self._conn.execute("DELETE FROM broadcast_targets WHERE alias = ?", (alias,)).rowcount
+
+    def has(self, alias: str) -> bool:
+        alias = self.normalize_alias(alias)
+        if alias == ALL_TARGETS:
+            return True
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM broadcast_targets WHERE alias = ? LIMIT 1", (alias,)
+            ).fetchone() is not None
+
+    def recipients(self, alias: str) -> list:
+        """Returns the recipients for `alias`, or every registered recipient for 'all'."""
+        alias = self.normalize_alias(alias)
+        with self._lock:
+            if alias == ALL_TARGETS:
+                rows = self._conn.execute("SELECT DISTINCT recipient_id FROM broadcast_targets ORDER BY recipient_id")
+            else:
+                rows = self._conn.execute(
+                    "SELECT recipient_id FROM broadcast_targets WHERE alias = ? ORDER BY recipient_id", (alias,)
+                )
+            return [row[0] for row in rows]
+
+    def aliases(self) -> dict:
+        """Returns alias -> number of recipients."""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT alias, COUNT(*) FROM broadcast_targets GROUP BY alias ORDER BY alias"
+            ).fetchall())
+
+
+class _Pacer:
+    """Spaces out sends to at most `rate_per_second`, shared by every broadcast on this number."""
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_slot = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class Broadcaster:
+    """
+    Fans one message out to many recipients over the pooled async sender.
+
+    Every recipient is first written to the outbox (`Outbox.reserve()`), so a restart
+    or shutdown mid-broadcast leaves the unsent recipients queued there instead of
+    losing them. Sends run concurrently (up to `concurrency` in flight) but are paced
+    to `rate_per_second` to stay under WhatsApp's per-number throughput limits.
+    Transient failures (network errors, 429, 5xx) are retried with exponential
+    backoff and jitter, honoring Retry-After, up to `max_attempts` per recipient;
+    after that the outbox keeps retrying them (counted as deferred). Each result is
+    recorded with `Outbox.settle()`, so sent messages are tracked under the
+    `tag_prefix + broadcast id` tag and permanent failures land in the dead letters.
+    """
+
+    def __init__(self, send_func, outbox, rate_per_second: float = 50, concurrency: int = 32,
+                 max_attempts: int = 3, base_backoff: float = 1.0, progress_every: int = 100,
+                 tag_prefix: str = "broadcast:"):
+        self.send_func = send_func
+        self.outbox = outbox
+        self.tag_prefix = tag_prefix
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.base_backoff = base_backoff
+        self.progress_every = max(1, progress_every)
+
+        self._pacer = _Pacer(rate_per_second)
+        self._tasks = set()
+
+        self.broadcasts = 0
+        self.messages_sent = 0
+        self.messages_failed = 0
+        self.messages_deferred = 0
+
+    def launch(self, coro) -> asyncio.Task:
+        """Runs a broadcast in the background, tracked so shutdown can wait for it."""
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def stop(self, timeout: float = 10.0):
+        """Waits up to `timeout` for running broadcasts, then cancels what is left."""
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Cancelled {len(pending)} unfinished broadcasts on shutdown.")
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _send_with_retry(self, row: dict) -> str:
+        """Returns "sent", "failed" or "deferred"."""
+        recipient_id = row["recipient_id"]
+        for attempt in range(1, self.max_attempts + 1):
+            await self._pacer.wait()
+            try:
+                response = await self.send_func(recipient_id, row["body"])
+            except WhatsAppSendError as e:
+                if not e.transient or attempt == self.max_attempts:
+                    if await self.outbox.settle(row, error=e, tries=attempt) == "retrying":
+                        logger.warning(f"Broadcast to {recipient_id} deferred to the outbox after {attempt} attempts: {e}")
+                        return "deferred"
+                    logger.error(f"Broadcast to {recipient_id} failed after {attempt} attempts: {e}")
+                    return "failed"
+                delay = e.retry_after if e.retry_after is not None else self.base_backoff * 2 ** (attempt - 1)
+                await asyncio.sleep(delay + random.uniform(0, self.base_backoff))
+                continue
+            await self.outbox.settle(row, response)
+            return "sent"
+        return "failed"
+
+    async def broadcast(self, recipient_ids: list, message_body: str, on_progress=None) -> dict:
+        """
+        Sends `message_body` to every recipient and returns {"id", "total", "sent", "failed", "deferred", "pending"}.
+        `on_progress(result)` is awaited every `progress_every` completed recipients.
+        """
+        result = {
+            "id": uuid.uuid4().hex[:8],
+            "total": len(recipient_ids),
+            "sent": 0,
+            "failed": 0,
+            "deferred": 0,
+            "pending": len(recipient_ids),
+        }
+        rows = await asyncio.to_thread(
+            self.outbox.reserve, recipient_ids, message_body, tag=f"{self.tag_prefix}{result['id']}"
+        )
+        self.broadcasts += 1
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+        unsettled = {row["id"] for row in rows}
+
+        async def deliver(row):
+            async with semaphore:
+                try:
+                    outcome = await self._send_with_retry(row)
+                except Exception as e:
+                    logger.error(f"Broadcast to {row['recipient_id']} crashed; leaving it to the outbox: {e}")
+                    self.outbox.release([row["id"]])
+                    outcome = "deferred"
+            unsettled.discard(row["id"])
+            result[outcome] += 1
+            result["pending"] -= 1
+            done = result["total"] - result["pending"]
+            if on_progress and result["pending"] and done % self.progress_every == 0:
+                try:
+                    await on_progress(dict(result))
+                except Exception as e:
+                    logger.error(f"Broadcast progress callback failed: {e}")
+
+        try:
+            await asyncio.gather(*(deliver(row) for row in rows))
+        finally:
+            if unsettled:
+                # Cancelled or crashed part-way: the outbox sends the rest.
+                self.outbox.release(list(unsettled))
+                logger.warning(f"Broadcast {result['id']} interrupted; {len(unsettled)} recipients left to the outbox.")
+
+        self.messages_sent += result["sent"]
+        self.messages_failed += result["failed"]
+        self.messages_deferred += result["deferred"]
+        result["seconds"] = round(time.monotonic() - started, 2)
+        logger.info(f"Broadcast {result['id']} finished: {result['sent']}/{result['total']} sent, {result['failed']} failed, {result['deferred']} deferred in {result['seconds']}s.")
+        return result
+
+    def stats(self) -> dict:
+        """Returns broadcast totals and how many are currently running."""
+        return {
+            "running": len(self._tasks),
+            "broadcasts": self.broadcasts,
+            "messages_sent": self.messages_sent,
+            "messages_failed": self.messages_failed,
+            "messages_deferred": self.messages_deferred,
+        }
@@ -0,0 +1,94 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency after `failure_threshold` consecutive failures.
+
+    While open, `allow()` returns False so callers can fall back immediately. After
+    `recovery_timeout` seconds the breaker goes half-open on its own and lets up to
+    `half_open_max_calls` probe calls through: a success closes it again, a failure
+    re-opens it for another `recovery_timeout`.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._probe_started_at = 0.0
+        self._lock = threading.Lock()
+
+        self.rejected = 0
+        self.opened_count = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = STATE_HALF_OPEN
+            self._half_open_calls = 0
+            self._probe_started_at = 0.0
+            logger.info(f"Circuit '{self.name}' half-open: probing for recovery.")
+
+    def allow(self) -> bool:
+        """Returns True if a call may go through; counts a rejection otherwise."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_HALF_OPEN:
+                now = time.monotonic()
+                # A probe that never reported back (e.g. it was cancelled) must not wedge the breaker.
+                if now - self._probe_started_at >= self.recovery_timeout:
+                    self._half_open_calls = 0
+                if self._half_open_calls < self.half_open_max_calls:
+                    self._half_open_calls += 1
+                    self._probe_started_at = now
+                    return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != STATE_CLOSED:
+                logger.info(f"Circuit '{self.name}' closed: dependency recovered.")
+            self._state = STATE_CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == STATE_HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != STATE_OPEN:
+                    self.opened_count += 1
+                    logger.warning(f"Circuit '{self.name}' opened after {self._failures} consecutive failures.")
+                self._state = STATE_OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        """Returns the breaker state and how many calls it has rejected."""
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "rejected": self.rejected,
+            "opened_count": self.opened_count,
+        }
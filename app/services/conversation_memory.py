@@ -0,0 +1,89 @@
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationMemory:
+    """
+    Recent chat turns per chat, for giving AI replies some context.
+
+    Each chat keeps a ring buffer of at most `max_turns` turns, and every turn is
+    truncated to `max_chars`, so a chat never holds more than max_turns * max_chars
+    characters however long it runs. At most `max_chats` chats are kept; the least
+    recently active one is evicted first, and chats idle for `idle_seconds` are
+    forgotten on their next access.
+    """
+
+    def __init__(self, enabled: bool = True, max_turns: int = 10, max_chars: int = 500,
+                 max_chats: int = 5000, idle_seconds: float = 6 * 3600):
+        self.enabled = enabled
+        self.max_turns = max(1, max_turns)
+        self.max_chars = max(1, max_chars)
+        self.max_chats = max(1, max_chats)
+        self.idle_seconds = idle_seconds
+
+        self._chats = OrderedDict()  # chat_id -> (last_active, deque[(role, text)])
+        self._lock = threading.Lock()
+        self._turns = 0  # turns held across all chats, kept up to date so stats() is O(1)
+
+        self.evictions = 0
+        self.expirations = 0
+
+    def _get(self, chat_id: str, now: float):
+        entry = self._chats.get(chat_id)
+        if entry is not None and now - entry[0] >= self.idle_seconds:
+            del self._chats[chat_id]
+            self._turns -= len(entry[1])
+            self.expirations += 1
+            return None
+        return entry
+
+    def add(self, chat_id: str, role: str, text: str):
+        """Appends a turn ("user" or "assistant") to the chat, dropping its oldest turn when full."""
+        if not self.enabled or not chat_id or not text:
+            return
+        if len(text) > self.max_chars:
+            text = text[:self.max_chars - 1] + "…"
+        now = time.monotonic()
+        with self._lock:
+            entry = self._get(chat_id, now)
+            turns = entry[1] if entry is not None else deque(maxlen=self.max_turns)
+            if len(turns) < self.max_turns:
+                self._turns += 1
+            turns.append((role, text))
+            self._chats[chat_id] = (now, turns)
+            self._chats.move_to_end(chat_id)
+            while len(self._chats) > self.max_chats:
+                _, (_, evicted) = self._chats.popitem(last=False)
+                self._turns -= len(evicted)
+                self.evictions += 1
+
+    def history(self, chat_id: str) -> list:
+        """Returns the chat's turns as (role, text) pairs, oldest first."""
+        if not self.enabled or not chat_id:
+            return []
+        with self._lock:
+            entry = self._get(chat_id, time.monotonic())
+            return list(entry[1]) if entry is not None else []
+
+    def clear(self, chat_id: str):
+        with self._lock:
+            entry = self._chats.pop(chat_id, None)
+            if entry is not None:
+                self._turns -= len(entry[1])
+
+    def stats(self) -> dict:
+        """Returns the number of chats and turns held, and eviction counters (constant time)."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "chats": len(self._chats),
+                "max_chats": self.max_chats,
+                "turns": self._turns,
+                "max_turns_per_chat": self.max_turns,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
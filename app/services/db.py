@@ -0,0 +1,51 @@
+import os
+import sqlite3
+import threading
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Opens a SQLite connection in WAL mode, shared safely between the bot's worker processes.
+    The connection is in autocommit mode; callers use explicit transactions for batches
+    and guard the connection with their own lock when used from several threads.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL + NORMAL only fsyncs at checkpoints, which keeps single-row writes cheap.
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+class LazyConnection:
+    """
+    A `connect()` connection that is opened, and its schema statements run, on first use.
+    A schema entry is either an SQL statement or a callable taking the connection (for migrations).
+    Stores hold one of these so they can be built at import time without touching the
+    file system; the database file and its tables appear when the app first needs them.
+    """
+
+    def __init__(self, path: str, schema: tuple = ()):
+        self.path = path
+        self.schema = schema
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def get(self) -> sqlite3.Connection:
+        conn = self._conn
+        if conn is None:
+            with self._lock:
+                if self._conn is None:
+                    conn = connect(self.path)
+                    for statement in self.schema:
+                        if callable(statement):
+                            statement(conn)
+                        else:
+                            conn.execute(statement)
+                    self._conn = conn
+                conn = self._conn
+        return conn
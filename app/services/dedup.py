@@ -0,0 +1,108 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from .db import LazyConnection
+
+logger = logging.getLogger(__name__)
+
+# Expired rows are pruned from the SQLite table once every this many inserts.
+_PRUNE_EVERY = 1000
+
+
+class SeenCache:
+    """
+    Bounded LRU + TTL set of WhatsApp message ids used to drop webhook redeliveries.
+
+    The in-memory map answers repeat lookups without I/O. When `db_path` is set,
+    ids are also recorded in SQLite so the cache survives restarts and is shared
+    by every worker process pointing at the same file.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 86400, db_path: str = None):
+        self.max_size = max(1, max_size)
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+
+        self._seen = OrderedDict()  # message_id -> first seen (epoch seconds)
+        self._lock = threading.Lock()
+        self._db = None
+        self._inserts = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        if db_path:
+            self._db = LazyConnection(db_path, (
+                "CREATE TABLE IF NOT EXISTS seen_messages ("
+                " message_id TEXT PRIMARY KEY,"
+                " seen_at REAL NOT NULL)",
+                "CREATE INDEX IF NOT EXISTS idx_seen_messages_seen_at ON seen_messages (seen_at)",
+            ))
+            logger.info(f"SeenCache persisting message ids to {db_path}.")
+
+    @property
+    def _conn(self):
+        return self._db.get() if self._db is not None else None
+
+    def check_and_add(self, message_id: str) -> bool:
+        """Returns True if `message_id` was already seen within the TTL, otherwise records it and returns False."""
+        now = time.time()
+        with self._lock:
+            seen_at = self._seen.get(message_id)
+            if seen_at is not None and now - seen_at < self.ttl_seconds:
+                self._seen.move_to_end(message_id)
+                self.hits += 1
+                return True
+
+            if self._db is not None and self._check_and_add_db(message_id, now):
+                self._remember(message_id, now)
+                self.hits += 1
+                return True
+
+            self._remember(message_id, now)
+            self.misses += 1
+            return False
+
+    def discard(self, message_id: str):
+        """Forgets `message_id`, e.g. when the message could not be queued and Meta should redeliver it."""
+        with self._lock:
+            self._seen.pop(message_id, None)
+            if self._db is not None:
+                self._conn.execute("DELETE FROM seen_messages WHERE message_id = ?", (message_id,))
+
+    def _remember(self, message_id: str, now: float):
+        self._seen[message_id] = now
+        self._seen.move_to_end(message_id)
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+    def _check_and_add_db(self, message_id: str, now: float) -> bool:
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO seen_messages (message_id, seen_at) VALUES (?, ?)",
+            (message_id, now)
+        )
+        if cursor.rowcount == 1:
+            self._inserts += 1
+            if self._inserts % _PRUNE_EVERY == 0:
+                self._conn.execute("DELETE FROM seen_messages WHERE seen_at < ?", (now - self.ttl_seconds,))
+            return False
+
+        # Already recorded (possibly by another worker); an expired row counts as new.
+        cursor = self._conn.execute(
+            "UPDATE seen_messages SET seen_at = ? WHERE message_id = ? AND seen_at < ?",
+            (now, message_id, now - self.ttl_seconds)
+        )
+        return cursor.rowcount == 0
+
+    def stats(self) -> dict:
+        """Returns duplicate hit/miss counters and the current cache size."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._seen),
+            "max_size": self.max_size,
+            "persistent": self._db is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
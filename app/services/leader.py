@@ -0,0 +1,86 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from .db import LazyConnection
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """
+    Leader election between worker processes through a lease row in a shared SQLite file.
+
+    Every worker calls `try_acquire()` periodically (well within `ttl`). The holder
+    renews its lease; the others only take over once it has expired, so if the
+    leader process dies another worker becomes leader within `ttl` seconds.
+    No external service is needed, only a database file all workers can reach.
+    """
+
+    def __init__(self, db_path: str, name: str = "scheduler", ttl: float = 15.0):
+        self.name = name
+        self.ttl = ttl
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+        self._lock = threading.Lock()
+        self._db = LazyConnection(db_path, (
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " name TEXT PRIMARY KEY,"
+            " owner TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)",
+        ))
+        self.is_leader = False
+        self.acquired_count = 0
+
+    @property
+    def _conn(self):
+        return self._db.get()
+
+    def try_acquire(self) -> bool:
+        """Takes or renews the lease if it is free, expired or already ours. Returns whether we hold it."""
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                row = self._conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (self.name,)).fetchone()
+                if row is None or row[0] == self.owner_id or row[1] < now:
+                    self._conn.execute(
+                        "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+                        (self.name, self.owner_id, now + self.ttl)
+                    )
+                    held = True
+                else:
+                    held = False
+                self._conn.execute("COMMIT")
+            except Exception as e:
+                try:
+                    self._conn.execute("ROLLBACK")
+                except Exception:
+                    pass
+                logger.error(f"Lease '{self.name}' heartbeat failed: {e}")
+                held = False
+
+            if held and not self.is_leader:
+                self.acquired_count += 1
+                logger.info(f"Acquired '{self.name}' lease as {self.owner_id}.")
+            elif self.is_leader and not held:
+                logger.warning(f"Lost '{self.name}' lease ({self.owner_id}).")
+            self.is_leader = held
+            return held
+
+    def release(self):
+        """Gives the lease up immediately so another worker can take over without waiting for expiry."""
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (self.name, self.owner_id))
+            self.is_leader = False
+
+    def stats(self) -> dict:
+        return {
+            "owner_id": self.owner_id,
+            "is_leader": self.is_leader,
+            "ttl_seconds": self.ttl,
+            "acquired_count": self.acquired_count,
+        }
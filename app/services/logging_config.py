@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+import logging.handlers
+
+# --- Logging Configuration ---
+# Records are put on a bounded queue by the caller and formatted/written by a listener thread.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" or "json"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Per-category controls for high-frequency events, e.g. "send=0.1,inbound=0.5" and "send=20,receipt=5".
+# Sampling keeps that fraction of records; rate limits allow that many records per second.
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+LOG_RATE_LIMITS = os.getenv("LOG_RATE_LIMITS", "")
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# Uvicorn gives these loggers their own stream handlers with propagate=False, so without
+# rerouting every request's access line is written synchronously on the event loop.
+SERVER_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+# Libraries that log an INFO line per HTTP call (httpx: every Graph send and OpenAI request)
+# or per job run (APScheduler: every few seconds per worker); kept at WARNING unless LOG_LEVEL=DEBUG.
+CHATTY_LOGGERS = ("httpx", "apscheduler")
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and goes into JSON output.
+# color_message is uvicorn's ANSI-colored copy of the message.
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName", "color_message"}
+
+
+def parse_category_values(spec: str) -> dict:
+    """Parses "send=0.1,receipt=0.01" into {"send": 0.1, "receipt": 0.01}."""
+    values = {}
+    for part in spec.split(","):
+        name, _, value = part.partition("=")
+        if name.strip() and value.strip():
+            values[name.strip()] = float(value)
+    return values
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, plus any `extra=` fields (e.g. category)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class CategoryFilter(logging.Filter):
+    """
+    Samples and rate-limits records tagged with `extra={"category": ...}`.
+
+    Records at WARNING and above, and records without a category, always pass. A
+    category's rate limit is a token bucket refilled at that many records per second
+    (burst of one second's worth). Dropped records are counted per category.
+    """
+
+    def __init__(self, sample_rates: dict = None, rate_limits: dict = None):
+        super().__init__()
+        self.sample_rates = dict(sample_rates or {})
+        self.rate_limits = dict(rate_limits or {})
+        self._buckets = {name: [float(rate), time.monotonic()] for name, rate in self.rate_limits.items()}
+        self._lock = threading.Lock()
+        self.dropped = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        category = getattr(record, "category", None)
+        if category is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.sample_rates.get(category)
+        if rate is not None and random.random() >= rate:
+            return self._drop(category)
+        limit = self.rate_limits.get(category)
+        if limit is not None:
+            with self._lock:
+                bucket = self._buckets[category]
+                now = time.monotonic()
+                bucket[0] = min(limit, bucket[0] + (now - bucket[1]) * limit)
+                bucket[1] = now
+                if bucket[0] < 1:
+                    return self._drop(category)
+                bucket[0] -= 1
+        return True
+
+    def _drop(self, category: str) -> bool:
+        self.dropped[category] = self.dropped.get(category, 0) + 1
+        return False
+
+
+class _DefaultCategory(logging.Filter):
+    """Tags records from a logger with `category` (unless they already have one), so they can be sampled."""
+
+    def __init__(self, category: str):
+        super().__init__()
+        self.category = category
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "category", None) is None:
+            record.category = self.category
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records without formatting them (the listener formats) and drops them when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The queue is in-process, so the record needn't be made picklable. Formatting stays on the listener.
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_listener_lock = threading.Lock()
+_queue_handler = None
+_stream_handler = None
+_category_filter = None
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, queue_size: int = LOG_QUEUE_SIZE,
+                      sample_rates: dict = None, rate_limits: dict = None):
+    """
+    Routes the root logger through a bounded queue; `start_logging()` starts the thread that
+    formats and writes the records to stderr. Records logged before then wait in the queue.
+    Safe to call more than once; later calls replace the earlier setup.
+    """
+    global _queue_handler, _stream_handler, _category_filter
+    stop_logging()
+
+    _stream_handler = logging.StreamHandler(sys.stderr)
+    _stream_handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    _category_filter = CategoryFilter(
+        parse_category_values(LOG_SAMPLE_RATES) if sample_rates is None else sample_rates,
+        parse_category_values(LOG_RATE_LIMITS) if rate_limits is None else rate_limits,
+    )
+    _queue_handler = _QueueHandler(queue.Queue(maxsize=max(1, queue_size)))
+    _queue_handler.addFilter(_category_filter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    for name in CHATTY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.NOTSET if root.level <= logging.DEBUG else logging.WARNING)
+    route_server_loggers()
+
+
+def route_server_loggers():
+    """
+    Sends uvicorn's records (startup messages, errors and per-request access lines) through
+    the root queue instead of their own synchronous stream handlers. Access lines carry the
+    "access" category, so they can be sampled or rate-limited like the bot's own hot-path logs.
+    """
+    for name in SERVER_LOGGERS:
+        server_logger = logging.getLogger(name)
+        for handler in list(server_logger.handlers):
+            server_logger.removeHandler(handler)
+        server_logger.propagate = True
+    access_logger = logging.getLogger("uvicorn.access")
+    if not any(isinstance(f, _DefaultCategory) for f in access_logger.filters):
+        access_logger.addFilter(_DefaultCategory("access"))
+
+
+def start_logging():
+    """
+    Starts the listener thread (no-op if it is running or logging isn't configured).
+    Also reroutes uvicorn's loggers again, in case uvicorn configured them after the app was imported.
+    """
+    global _listener
+    if _queue_handler is not None:
+        route_server_loggers()
+    with _listener_lock:
+        if _listener is None and _queue_handler is not None:
+            _listener = logging.handlers.QueueListener(_queue_handler.queue, _stream_handler, respect_handler_level=True)
+            _listener.start()
+
+
+def stop_logging():
+    """Writes out queued records and stops the listener thread."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _flush_at_exit():
+    # Also covers processes that never ran the app lifespan (scripts, tests): their records are still written.
+    start_logging()
+    stop_logging()
+
+
+def logging_stats() -> dict:
+    """Returns the queue depth and how many records were dropped (queue full or sampled/rate-limited)."""
+    if _queue_handler is None:
+        return {"queued": 0, "dropped_queue_full": 0, "dropped_by_category": {}}
+    return {
+        "queued": _queue_handler.queue.qsize(),
+        "dropped_queue_full": _queue_handler.dropped,
+        "dropped_by_category": dict(_category_filter.dropped),
+    }
+
+
+atexit.register(_flush_at_exit)
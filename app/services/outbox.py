@@ -0,0 +1,411 @@
+import os
+import time
+import uuid
+import random
+import socket
+import sqlite3
+import asyncio
+import logging
+import threading
+from .db import LazyConnection
+from .whatsapp_client import WhatsAppSendError
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = "id, recipient_id, body, message_type, tag, attempts, created_at"
+# Each recipient's oldest row: only that row may be sent, so a row waiting for a retry
+# holds back the recipient's later messages.
+_HEAD_ROWS = "id IN (SELECT MIN(id) FROM outbox GROUP BY recipient_id)"
+
+
+def _add_claimed_by(conn: sqlite3.Connection):
+    """Adds the claim owner column to outbox tables created before it existed."""
+    if any(row[1] == "claimed_by" for row in conn.execute("PRAGMA table_info(outbox)")):
+        return
+    try:
+        conn.execute("ALTER TABLE outbox ADD COLUMN claimed_by TEXT")
+    except sqlite3.OperationalError:
+        # Another worker added it first
+        pass
+
+
+class Outbox:
+    """
+    Durable queue of outbound WhatsApp messages in SQLite (WAL), drained by async senders.
+
+    `enqueue()` is a single-row insert (no fsync with WAL + synchronous=NORMAL), but it
+    can wait on the shared lock or SQLite's busy timeout, so async code calls it through
+    `asyncio.to_thread`. A dispatcher task claims due rows and hands them to
+    `sender_count` sender tasks. Only a recipient's oldest row is ever claimed, and only once it is due, so at most one message per recipient is in flight
+    and a message waiting for a retry holds back that recipient's later ones. Transient failures (network
+    errors, 429, 5xx) are retried with exponential backoff and jitter, honoring
+    Retry-After; permanent failures and messages that run out of attempts are moved
+    to the dead-letter table. Claimed rows carry a lease and the claiming outbox's
+    `owner_id`, so several worker processes can drain the same file, `stop()` only
+    gives back this process's claims, and rows left by a crashed process are sent
+    once their lease runs out. Only as many rows are claimed as there are idle
+    senders, so a claim never waits out its lease in a queue, and leases on rows this
+    process still holds are renewed while it runs.
+
+    Broadcasts `reserve()` their rows up front (already claimed by this outbox), send
+    them on their own pacing, and report each outcome through `settle()`. A broadcast
+    that is interrupted leaves its unsent recipients queued here instead of losing them.
+    """
+
+    def __init__(self, db_path: str, send_func, sender_count: int = 4, max_attempts: int = 6,
+                 base_backoff: float = 1.0, max_backoff: float = 300.0, claim_lease: float = 60.0,
+                 poll_interval: float = 1.0, batch_size: int = 50, on_sent=None):
+        self.send_func = send_func
+        self.sender_count = max(1, sender_count)
+        self.max_attempts = max(1, max_attempts)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.claim_lease = claim_lease
+        self.poll_interval = poll_interval
+        self.batch_size = max(1, batch_size)
+        # on_sent(row, response) is called after every successful send (row has recipient_id, tag, ...)
+        self.on_sent = on_sent
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+        self._lock = threading.Lock()
+        self._db = LazyConnection(db_path, (
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " recipient_id TEXT NOT NULL,"
+            " body TEXT NOT NULL,"
+            " message_type TEXT NOT NULL,"
+            " tag TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL,"
+            " locked_until REAL NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " last_error TEXT,"
+            " claimed_by TEXT)",
+            _add_claimed_by,
+            "CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt_at ON outbox (next_attempt_at)",
+            "CREATE INDEX IF NOT EXISTS idx_outbox_recipient ON outbox (recipient_id, id)",
+            "CREATE TABLE IF NOT EXISTS outbox_dead_letters ("
+            " id INTEGER PRIMARY KEY,"
+            " recipient_id TEXT NOT NULL,"
+            " body TEXT NOT NULL,"
+            " message_type TEXT NOT NULL,"
+            " tag TEXT,"
+            " attempts INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " failed_at REAL NOT NULL,"
+            " status_code INTEGER,"
+            " last_error TEXT)",
+        ))
+
+        self._loop = None
+        self._wakeup = None
+        self._ready = None
+        self._tasks = []
+        self._in_flight = set()  # recipient ids with a message being sent
+        self._held = set()  # ids of rows claimed or reserved by this outbox and not yet settled
+        self._renewed_at = 0.0
+
+        # Stats for this process (see pending_count() for the shared queue length)
+        self.enqueued = 0
+        self.sent = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+    @property
+    def _conn(self):
+        return self._db.get()
+
+    def pending_count(self) -> int:
+        """Counts unsent rows in the shared table, across every worker draining it. Reads SQLite."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    async def start(self):
+        """Starts the dispatcher and sender tasks on the running event loop; resumes rows left from a previous run."""
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        pending = await asyncio.to_thread(self.pending_count)
+        self._wakeup = asyncio.Event()
+        self._ready = asyncio.Queue(maxsize=self.sender_count)
+        self._tasks = [asyncio.create_task(self._dispatch(), name="outbox-dispatcher")]
+        self._tasks += [
+            asyncio.create_task(self._sender(), name=f"outbox-sender-{i}")
+            for i in range(self.sender_count)
+        ]
+        if pending:
+            logger.info(f"Outbox resuming {pending} queued messages.")
+
+    async def stop(self, timeout: float = 10.0):
+        """Waits up to `timeout` for due messages to go out, then stops. Unsent rows stay queued on disk."""
+        if not self._tasks:
+            return
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and (self._in_flight or await asyncio.to_thread(self._has_due)):
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Give back our claims that never reached a sender, so they are sent right away
+        # (by another worker, or by this one after the restart). Other workers' claims are left alone.
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET locked_until = 0, claimed_by = NULL WHERE claimed_by = ? AND locked_until > ?",
+                (self.owner_id, time.time())
+            )
+            self._held.clear()
+        self._in_flight.clear()
+
+    def enqueue(self, recipient_id: str, message_body: str, message_type: str = "text", tag: str = None) -> int:
+        """Durably queues a message for sending and returns its outbox id. Safe to call from any thread."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (recipient_id, body, message_type, tag, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (recipient_id, message_body, message_type, tag, now, now)
+            )
+            self.enqueued += 1
+        self._wake()
+        return cursor.lastrowid
+
+    def reserve(self, recipient_ids: list, message_body: str, message_type: str = "text", tag: str = None) -> list:
+        """
+        Durably queues one message per recipient in a single transaction, already claimed by this
+        outbox, and returns the rows. The caller sends them and reports each result with `settle()`;
+        rows it doesn't settle must be handed back with `release()`. Reserved rows are sent by the
+        caller right away, so they don't wait behind a recipient's earlier queued messages.
+        """
+        now = time.time()
+        rows = []
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for recipient_id in recipient_ids:
+                    cursor = self._conn.execute(
+                        "INSERT INTO outbox (recipient_id, body, message_type, tag, next_attempt_at, locked_until, "
+                        "claimed_by, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (recipient_id, message_body, message_type, tag, now, now + self.claim_lease, self.owner_id, now)
+                    )
+                    rows.append({
+                        "id": cursor.lastrowid, "recipient_id": recipient_id, "body": message_body,
+                        "message_type": message_type, "tag": tag, "attempts": 0, "created_at": now,
+                    })
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.enqueued += len(rows)
+            self._held.update(row["id"] for row in rows)
+        return rows
+
+    def release(self, row_ids: list):
+        """Hands claimed or reserved rows back to the queue unsent, so the dispatcher sends them."""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET locked_until = 0, claimed_by = NULL WHERE id = ? AND claimed_by = ?",
+                [(row_id, self.owner_id) for row_id in row_ids]
+            )
+            self._held.difference_update(row_ids)
+        self._wake()
+
+    def _wake(self):
+        loop = self._loop
+        if loop is None or self._wakeup is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._wakeup.set()
+        elif loop.is_running():
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _has_due(self) -> bool:
+        now = time.time()
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT 1 FROM outbox WHERE {_HEAD_ROWS} AND next_attempt_at <= ? AND locked_until < ? LIMIT 1",
+                (now, now)
+            ).fetchone() is not None
+
+    def _claim(self, busy: set, limit: int) -> tuple:
+        """
+        Leases up to `limit` due rows, each the oldest row of its recipient, skipping `busy` recipients.
+        Returns (rows, seconds until the next row is due or None).
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                candidates = self._conn.execute(
+                    f"SELECT {_COLUMNS} FROM outbox WHERE {_HEAD_ROWS} AND next_attempt_at <= ? AND locked_until < ? "
+                    "ORDER BY id LIMIT ?",
+                    (now, now, limit + len(busy))
+                ).fetchall()
+                rows = [{
+                    "id": row[0], "recipient_id": row[1], "body": row[2], "message_type": row[3],
+                    "tag": row[4], "attempts": row[5], "created_at": row[6],
+                } for row in candidates if row[1] not in busy][:limit]
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE outbox SET locked_until = ?, claimed_by = ? WHERE id = ?",
+                        [(now + self.claim_lease, self.owner_id, row["id"]) for row in rows]
+                    )
+                    self._held.update(row["id"] for row in rows)
+                next_due = self._conn.execute(
+                    "SELECT MIN(next_attempt_at) FROM outbox WHERE next_attempt_at > ?", (now,)
+                ).fetchone()[0]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rows, (next_due - now if next_due is not None else None)
+
+    def _renew_claims(self):
+        """Extends the lease on every row this outbox still holds, so long broadcasts keep their claims."""
+        with self._lock:
+            held = list(self._held)
+            if held:
+                self._conn.executemany(
+                    "UPDATE outbox SET locked_until = ? WHERE id = ? AND claimed_by = ?",
+                    [(time.time() + self.claim_lease, row_id, self.owner_id) for row_id in held]
+                )
+
+    async def _dispatch(self):
+        while True:
+            if time.monotonic() - self._renewed_at >= self.claim_lease / 3:
+                self._renewed_at = time.monotonic()
+                try:
+                    await asyncio.to_thread(self._renew_claims)
+                except Exception as e:
+                    logger.error(f"Outbox lease renewal failed: {e}")
+            self._wakeup.clear()
+            # Only claim rows a sender can take right away: a claimed row waiting in a queue
+            # could outlive its lease and be sent a second time by another worker.
+            free = self.sender_count - len(self._in_flight)
+            rows, next_in = [], None
+            if free > 0:
+                try:
+                    rows, next_in = await asyncio.to_thread(
+                        self._claim, set(self._in_flight), min(free, self.batch_size)
+                    )
+                except Exception as e:
+                    logger.error(f"Outbox claim failed: {e}")
+            for row in rows:
+                self._in_flight.add(row["recipient_id"])
+                self._ready.put_nowait(row)
+            if rows:
+                continue
+            timeout = self.poll_interval if next_in is None else min(self.poll_interval, max(0.0, next_in))
+            # Not wait_for: on Python 3.11 it can swallow a cancel that lands as the event is set,
+            # and stop() would then wait for the dispatcher forever.
+            wakeup = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait((wakeup,), timeout=timeout)
+            finally:
+                wakeup.cancel()
+
+    async def _sender(self):
+        while True:
+            row = await self._ready.get()
+            try:
+                await self._send(row)
+            except Exception as e:
+                logger.error(f"Outbox send of message {row['id']} crashed: {e}")
+            finally:
+                self._in_flight.discard(row["recipient_id"])
+                # Unsettled after a crash: stop renewing it, so the lease runs out and it is retried.
+                with self._lock:
+                    self._held.discard(row["id"])
+                self._wake()
+
+    async def _send(self, row: dict):
+        try:
+            response = await self.send_func(row["recipient_id"], row["body"], row["message_type"])
+        except WhatsAppSendError as e:
+            await self.settle(row, error=e)
+            return
+        await self.settle(row, response)
+
+    async def settle(self, row: dict, response: dict = None, error: WhatsAppSendError = None, tries: int = 1) -> str:
+        """
+        Records the result of sending a claimed or reserved row after `tries` attempts: deletes it
+        when sent, reschedules it with backoff on a transient `error`, or moves it to the dead letters.
+        Returns "sent", "retrying" or "dead_lettered".
+        """
+        if error is None:
+            await asyncio.to_thread(self._complete, row)
+            if self.on_sent is not None:
+                self.on_sent(row, response)
+            return "sent"
+
+        attempts = row["attempts"] + tries
+        if not error.transient or attempts >= self.max_attempts:
+            await asyncio.to_thread(self._dead_letter, row, attempts, error)
+            return "dead_lettered"
+        delay = error.retry_after if error.retry_after is not None else min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+        delay += random.uniform(0, self.base_backoff)
+        await asyncio.to_thread(self._reschedule, row, attempts, delay, error)
+        return "retrying"
+
+    def _complete(self, row: dict):
+        with self._lock:
+            self._conn.execute("DELETE FROM outbox WHERE id = ?", (row["id"],))
+            self._held.discard(row["id"])
+            self.sent += 1
+
+    def _reschedule(self, row: dict, attempts: int, delay: float, error: WhatsAppSendError):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET attempts = ?, next_attempt_at = ?, locked_until = 0, claimed_by = NULL, last_error = ? "
+                "WHERE id = ?",
+                (attempts, time.time() + delay, str(error)[:500], row["id"])
+            )
+            self._held.discard(row["id"])
+            self.retried += 1
+        logger.warning(f"Send to {row['recipient_id']} failed (attempt {attempts}/{self.max_attempts}); retrying in {delay:.1f}s: {error}")
+
+    def _dead_letter(self, row: dict, attempts: int, error: WhatsAppSendError):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO outbox_dead_letters "
+                    "(id, recipient_id, body, message_type, tag, attempts, created_at, failed_at, status_code, last_error) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (row["id"], row["recipient_id"], row["body"], row["message_type"], row["tag"], attempts,
+                     row["created_at"], time.time(), error.status_code, str(error)[:500])
+                )
+                self._conn.execute("DELETE FROM outbox WHERE id = ?", (row["id"],))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._held.discard(row["id"])
+            self.dead_lettered += 1
+        logger.error(f"Send to {row['recipient_id']} failed permanently after {attempts} attempts; moved to dead letters: {error}")
+
+    def dead_letters(self, limit: int = 50) -> list:
+        """Returns the most recent dead-lettered messages."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, recipient_id, body, tag, attempts, failed_at, status_code, last_error "
+                "FROM outbox_dead_letters ORDER BY failed_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [{
+            "id": row[0], "recipient_id": row[1], "body": row[2], "tag": row[3], "attempts": row[4],
+            "failed_at": row[5], "status_code": row[6], "last_error": row[7],
+        } for row in rows]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "held": len(self._held),
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+        }
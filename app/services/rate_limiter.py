@@ -0,0 +1,81 @@
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+ALLOW = "allow"
+THROTTLE_NOTIFY = "throttle_notify"  # First rejection in a throttled streak: tell the sender once
+THROTTLE_SILENT = "throttle_silent"  # Later rejections in the same streak: drop quietly
+
+
+class RateLimiter:
+    """
+    In-memory token buckets keyed by (sender, category), each category with its own budget.
+
+    `budgets` maps a category name to (burst, refill_per_second). Every check is O(1):
+    buckets live in an LRU-ordered dict, refill lazily from their last-seen time, and
+    the least recently used buckets are evicted once they have been idle for
+    `idle_ttl` seconds or the dict grows past `max_buckets`.
+    """
+
+    def __init__(self, budgets: dict, max_buckets: int = 10000, idle_ttl: float = 600, enabled: bool = True):
+        self.budgets = budgets
+        self.max_buckets = max(1, max_buckets)
+        self.idle_ttl = idle_ttl
+        self.enabled = enabled
+
+        self._buckets = OrderedDict()  # (key, category) -> [tokens, last_refill, notified]
+
+        self.allowed = 0
+        self.throttled = 0
+        self.evicted = 0
+
+    def check(self, key: str, category: str) -> str:
+        """Takes a token from the sender's bucket for `category` and returns ALLOW, THROTTLE_NOTIFY or THROTTLE_SILENT."""
+        budget = self.budgets.get(category)
+        if not self.enabled or budget is None:
+            return ALLOW
+
+        burst, rate = budget
+        now = time.monotonic()
+        bucket_key = (key, category)
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self._buckets[bucket_key] = [float(burst), now, False]
+            self._evict(now)
+        else:
+            self._buckets.move_to_end(bucket_key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            bucket[2] = False
+            self.allowed += 1
+            return ALLOW
+
+        self.throttled += 1
+        if bucket[2]:
+            return THROTTLE_SILENT
+        bucket[2] = True
+        logger.warning(f"Rate limit hit: {key} exceeded the '{category}' budget.")
+        return THROTTLE_NOTIFY
+
+    def _evict(self, now: float):
+        while self._buckets:
+            bucket_key, bucket = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_buckets and now - bucket[1] < self.idle_ttl:
+                break
+            del self._buckets[bucket_key]
+            self.evicted += 1
+
+    def stats(self) -> dict:
+        """Returns bucket count and allow/throttle counters."""
+        return {
+            "enabled": self.enabled,
+            "buckets": len(self._buckets),
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,239 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from .db import LazyConnection
+
+logger = logging.getLogger(__name__)
+
+# Receipt statuses as stored (small ints keep the receipts table compact).
+STATUS_CODES = {"sent": 0, "delivered": 1, "read": 2, "failed": 3}
+
+# Old rows are pruned once every this many flushes.
+_PRUNE_EVERY = 100
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ReceiptSink:
+    """
+    Cheap landing spot for delivery/read receipts ("statuses") from the webhook and
+    for the ids of tracked outbound messages.
+
+    `add()` and `record_sent()` only append compact tuples to bounded in-memory
+    buffers, so receipt floods never reach model validation, the work queue,
+    per-receipt logging or the database. `drain()` hands buffered rows to the
+    ReceiptStore; when a buffer is full the oldest rows are dropped (and counted).
+    """
+
+    def __init__(self, max_buffer: int = 10000):
+        self.max_buffer = max(1, max_buffer)
+        self._buffer = deque()
+        self._sent = deque()
+        self._lock = threading.Lock()
+
+        # Stats
+        self.received = 0
+        self.tracked = 0
+        self.dropped = 0
+        self.by_status = {}
+
+    def add(self, statuses: list):
+        """Buffers raw WhatsApp status dicts as (message_id, status_code, timestamp, error_code)."""
+        with self._lock:
+            for status_data in statuses:
+                status = status_data.get("status")
+                if not isinstance(status, str):
+                    status = None
+                self.by_status[status] = self.by_status.get(status, 0) + 1
+                code = STATUS_CODES.get(status)
+                message_id = status_data.get("id")
+                if code is None or not message_id or not isinstance(message_id, str):
+                    continue
+                errors = status_data.get("errors")
+                error_code = errors[0].get("code") if isinstance(errors, list) and errors and isinstance(errors[0], dict) else None
+                if len(self._buffer) >= self.max_buffer:
+                    self._buffer.popleft()
+                    self.dropped += 1
+                # Receipts without a timestamp get the arrival time, so they are pruned like the rest.
+                at = _to_int(status_data.get("timestamp")) or int(time.time())
+                self._buffer.append((message_id, code, at, _to_int(error_code)))
+            self.received += len(statuses)
+        logger.debug(f"Buffered {len(statuses)} receipts.", extra={"category": "receipt"})
+
+    def record_sent(self, message_id: str, tag: str, recipient_id: str):
+        """Buffers an outbound message id under `tag` (e.g. "broadcast:<id>") so its receipts can be summarized."""
+        with self._lock:
+            if len(self._sent) >= self.max_buffer:
+                self._sent.popleft()
+                self.dropped += 1
+            self._sent.append((message_id, tag, recipient_id, time.time()))
+            self.tracked += 1
+
+    def drain(self) -> tuple:
+        """Removes and returns (sent_rows, receipt_rows), oldest first."""
+        with self._lock:
+            sent, self._sent = list(self._sent), deque()
+            receipts, self._buffer = list(self._buffer), deque()
+        return sent, receipts
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "tracked_sends": self.tracked,
+            "buffered": len(self._buffer) + len(self._sent),
+            "dropped": self.dropped,
+            "by_status": dict(self.by_status),
+        }
+
+
+class ReceiptStore:
+    """
+    SQLite aggregation of receipts for tracked outbound messages (broadcasts, reminders).
+
+    A background task drains the ReceiptSink every `flush_interval` seconds and writes
+    each batch with bulk inserts in one transaction, off the event loop. Only receipts
+    for tracked messages are kept (WhatsApp reports every chat reply too), one
+    (message_id, status) row each, so redelivered receipts are no-ops. Sends are written
+    before receipts, so a receipt flushed together with its send is still counted.
+    """
+
+    def __init__(self, db_path: str, sink: ReceiptSink, flush_interval: float = 2.0, retention_days: float = 30):
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self.retention_seconds = retention_days * 86400
+
+        self._lock = threading.Lock()
+        self._db = LazyConnection(db_path, (
+            "CREATE TABLE IF NOT EXISTS outbound_messages ("
+            " message_id TEXT PRIMARY KEY,"
+            " tag TEXT NOT NULL,"
+            " recipient_id TEXT,"
+            " sent_at REAL NOT NULL) WITHOUT ROWID",
+            "CREATE INDEX IF NOT EXISTS idx_outbound_messages_tag ON outbound_messages (tag, sent_at)",
+            "CREATE INDEX IF NOT EXISTS idx_outbound_messages_sent_at ON outbound_messages (sent_at)",
+            "CREATE TABLE IF NOT EXISTS message_receipts ("
+            " message_id TEXT NOT NULL,"
+            " status INTEGER NOT NULL,"
+            " at INTEGER,"
+            " error_code INTEGER,"
+            " PRIMARY KEY (message_id, status)) WITHOUT ROWID",
+            "CREATE INDEX IF NOT EXISTS idx_message_receipts_at ON message_receipts (at)",
+        ))
+        self._task = None
+        self._flushes = 0
+
+        # Stats
+        self.rows_written = 0
+        self.flush_errors = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def _conn(self):
+        return self._db.get()
+
+    async def start(self):
+        """Starts the periodic flush task on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="receipt-flusher")
+
+    async def stop(self):
+        """Stops the flush task and writes whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                self.flush_errors += 1
+                logger.error(f"Failed to flush receipts: {e}")
+
+    def flush(self) -> int:
+        """Writes buffered sends and receipts in one transaction. Returns the number of rows written."""
+        sent, receipts = self.sink.drain()
+        if not sent and not receipts:
+            return 0
+        started = time.perf_counter()
+        with self._lock:
+            changes = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            try:
+                if sent:
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO outbound_messages (message_id, tag, recipient_id, sent_at) VALUES (?, ?, ?, ?)",
+                        sent
+                    )
+                if receipts:
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO message_receipts (message_id, status, at, error_code) "
+                        "SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM outbound_messages WHERE message_id = ?)",
+                        [receipt + (receipt[0],) for receipt in receipts]
+                    )
+                written = self._conn.total_changes - changes
+                self._flushes += 1
+                if self._flushes % _PRUNE_EVERY == 0:
+                    self._prune()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.rows_written += written
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+        return written
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        # Rows with no `at` predate receipts being stamped on arrival.
+        self._conn.execute("DELETE FROM message_receipts WHERE at < ? OR at IS NULL", (int(cutoff),))
+        self._conn.execute("DELETE FROM outbound_messages WHERE sent_at < ?", (cutoff,))
+
+    def summaries(self, tag: str = None, prefix: str = None, limit: int = 10) -> list:
+        """
+        Returns per-tag delivery summaries, most recent first: total, delivered, read, failed,
+        read_rate and first_sent_at. Filters by exact `tag`, or by tag `prefix` (e.g. "broadcast:").
+        """
+        where, params = "", []
+        if tag is not None:
+            where, params = " WHERE o.tag = ?", [tag]
+        elif prefix is not None:
+            # Range on the tag index instead of LIKE, which can't use it
+            where, params = " WHERE o.tag >= ? AND o.tag < ?", [prefix, prefix + "\uffff"]
+        params.append(limit)
+        query = (
+            "SELECT o.tag, COUNT(*), "
+            " SUM(EXISTS (SELECT 1 FROM message_receipts r WHERE r.message_id = o.message_id AND r.status IN (1, 2))),"
+            " SUM(EXISTS (SELECT 1 FROM message_receipts r WHERE r.message_id = o.message_id AND r.status = 2)),"
+            " SUM(EXISTS (SELECT 1 FROM message_receipts r WHERE r.message_id = o.message_id AND r.status = 3)),"
+            " MIN(o.sent_at) "
+            f"FROM outbound_messages o{where} GROUP BY o.tag ORDER BY MIN(o.sent_at) DESC LIMIT ?"
+        )
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [{
+            "tag": row[0],
+            "total": row[1],
+            "delivered": row[2],
+            "read": row[3],
+            "failed": row[4],
+            "read_rate": round(row[3] / row[1], 3) if row[1] else 0.0,
+            "first_sent_at": row[5],
+        } for row in rows]
+
+    def stats(self) -> dict:
+        return {
+            "rows_written": self.rows_written,
+            "flush_errors": self.flush_errors,
+            "last_flush_ms": self.last_flush_ms,
+        }
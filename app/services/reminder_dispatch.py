@@ -0,0 +1,95 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def format_reminders(messages: list) -> str:
+    """Formats one or more reminders for the same recipient into a single WhatsApp message."""
+    if len(messages) == 1:
+        return f"🔔 *REMINDER* 🔔\n\n**From HOC/Asst HOC:**\n{messages[0]}"
+    lines = "\n".join(f"• {message}" for message in messages)
+    return f"🔔 *REMINDERS* 🔔\n\n**From HOC/Asst HOC:**\n{lines}"
+
+
+class ReminderDispatcher:
+    """
+    Delivery stage between scheduler jobs and the WhatsApp sender.
+
+    `submit()` only records the reminder and returns, so scheduler threads are freed
+    immediately. Reminders that arrive within one `window` are delivered together:
+    reminders for the same recipient are merged into one message. The flush hands each
+    merged message to `send(recipient_id, text)` on its own thread; that is the outbox
+    enqueue, so the reminders are durable again as soon as the flush returns and the
+    actual sends happen concurrently on the outbox's senders.
+    """
+
+    def __init__(self, window: float = 0.25):
+        self.window = window
+
+        self._pending = {}  # recipient_id -> [messages]
+        self._lock = threading.Lock()
+        self._timer = None
+
+        self._send = None
+
+        # Stats
+        self.reminders = 0
+        self.deliveries = 0
+        self.merged = 0
+        self.ticks = 0
+        self.failed = 0
+
+    def set_sender(self, func):
+        """Sets `func(recipient_id, text)`, which queues a delivery and returns False if it couldn't."""
+        self._send = func
+
+    def submit(self, recipient_id: str, message: str):
+        with self._lock:
+            self._pending.setdefault(recipient_id, []).append(message)
+            self.reminders += 1
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Delivers everything collected in the current tick."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not batch:
+            return
+
+        self.ticks += 1
+        count = sum(len(messages) for messages in batch.values())
+        deliveries = [(recipient_id, format_reminders(messages)) for recipient_id, messages in batch.items()]
+        self.deliveries += len(deliveries)
+        self.merged += count - len(deliveries)
+
+        if self._send is None:
+            self.failed += len(deliveries)
+            logger.error("No sender configured for reminder delivery.")
+            return
+        for recipient_id, text in deliveries:
+            try:
+                if self._send(recipient_id, text) is False:
+                    self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Failed to deliver reminder to {recipient_id}: {e}")
+
+        logger.info(f"Queued {count} reminders as {len(deliveries)} messages.")
+
+    def stats(self) -> dict:
+        """Returns how many reminders were coalesced into how many messages."""
+        return {
+            "reminders": self.reminders,
+            "deliveries": self.deliveries,
+            "merged": self.merged,
+            "ticks": self.ticks,
+            "failed": self.failed,
+            "pending": sum(len(messages) for messages in self._pending.values()),
+        }
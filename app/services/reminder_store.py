@@ -0,0 +1,131 @@
+import time
+import logging
+import threading
+from .db import LazyConnection
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = "id, sender_id, message, fire_at, created_at"
+
+
+def _row_to_dict(row) -> dict:
+    return {
+        "id": row[0],
+        "sender_id": row[1],
+        "message": row[2],
+        "fire_at": row[3],
+        "created_at": row[4],
+    }
+
+
+class ReminderStore:
+    """
+    Durable reminder table in SQLite (WAL), indexed by sender and by fire time.
+
+    The store is the source of truth: a reminder row exists until it is delivered
+    or cleared. The scheduler only keeps APScheduler jobs for the rows due within
+    its look-ahead horizon, and `claim()` guarantees a row is delivered once.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = LazyConnection(db_path, (
+            "CREATE TABLE IF NOT EXISTS reminders ("
+            " id TEXT PRIMARY KEY,"
+            " sender_id TEXT NOT NULL,"
+            " message TEXT NOT NULL,"
+            " fire_at REAL NOT NULL,"
+            " created_at REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS idx_reminders_sender ON reminders (sender_id, fire_at)",
+            "CREATE INDEX IF NOT EXISTS idx_reminders_fire_at ON reminders (fire_at)",
+            "CREATE INDEX IF NOT EXISTS idx_reminders_created_at ON reminders (created_at)",
+        ))
+
+    @property
+    def _conn(self):
+        return self._db.get()
+
+    def add(self, reminder_id: str, sender_id: str, message: str, fire_at: float):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO reminders ({_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                (reminder_id, sender_id, message, fire_at, time.time())
+            )
+
+    def claim(self, reminder_id: str):
+        """Removes and returns the reminder, or None if it was already delivered or cleared (by any process)."""
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM reminders WHERE id = ?", (reminder_id,)).fetchone()
+            if row is None:
+                return None
+            cursor = self._conn.execute("DELETE FROM reminders WHERE id = ?", (reminder_id,))
+            return _row_to_dict(row) if cursor.rowcount == 1 else None
+
+    def due_between(self, after: float, until: float, limit: int = None) -> list:
+        """Returns reminders with after < fire_at <= until, earliest first (uses the fire_at index)."""
+        query = f"SELECT {_COLUMNS} FROM reminders WHERE fire_at > ? AND fire_at <= ? ORDER BY fire_at"
+        params = (after, until)
+        if limit:
+            query += " LIMIT ?"
+            params += (limit,)
+        with self._lock:
+            return [_row_to_dict(row) for row in self._conn.execute(query, params)]
+
+    def created_since(self, since: float, fire_until: float) -> list:
+        """Returns reminders created after `since` that fire at or before `fire_until` (uses the created_at index)."""
+        with self._lock:
+            return [_row_to_dict(row) for row in self._conn.execute(
+                f"SELECT {_COLUMNS} FROM reminders WHERE created_at > ? AND fire_at <= ?",
+                (since, fire_until)
+            )]
+
+    def find(self, sender_id: str = None, after: float = None, before: float = None,
+             cursor: tuple = None, limit: int = 50) -> list:
+        """
+        Returns reminders ordered by (fire_at, id), optionally filtered by sender and fire-time range.
+        `cursor` is the (fire_at, id) of the last row of the previous page (keyset pagination).
+        """
+        clauses, params = [], []
+        if sender_id is not None:
+            clauses.append("sender_id = ?")
+            params.append(sender_id)
+        if after is not None:
+            clauses.append("fire_at >= ?")
+            params.append(after)
+        if before is not None:
+            clauses.append("fire_at < ?")
+            params.append(before)
+        if cursor is not None:
+            clauses.append("(fire_at, id) > (?, ?)")
+            params.extend(cursor)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        with self._lock:
+            return [_row_to_dict(row) for row in self._conn.execute(
+                f"SELECT {_COLUMNS} FROM reminders{where} ORDER BY fire_at, id LIMIT ?", params
+            )]
+
+    def delete_for_sender(self, sender_id: str) -> list:
+        """Deletes every reminder for `sender_id` (exact match) and returns their ids."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [row[0] for row in self._conn.execute(
+                    "SELECT id FROM reminders WHERE sender_id = ?", (sender_id,)
+                )]
+                self._conn.execute("DELETE FROM reminders WHERE sender_id = ?", (sender_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return ids
+
+    def delete_before(self, before: float) -> int:
+        """Drops reminders that were due before `before` and are too old to deliver."""
+        with self._lock:
+            return self._conn.execute("DELETE FROM reminders WHERE fire_at <= ?", (before,)).rowcount
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reminders").fetchone()[0]
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ReplyBatcher:
+    """
+    Collects concurrent reply requests for a short window and answers them with one completion.
+
+    Each message may carry its chat's earlier turns (`history`). `complete_batch(messages,
+    histories)` must return one reply per message, in order, or None if the model's
+    output could not be parsed; in that case every message in the batch is retried on
+    its own through `complete_single(message, history)`. A batch is sent when
+    `window_ms` has passed since its first message or it reaches `max_batch_size`.
+    """
+
+    def __init__(self, complete_batch, complete_single, window_ms: float = 30, max_batch_size: int = 8):
+        self.complete_batch = complete_batch
+        self.complete_single = complete_single
+        self.window = max(0.0, window_ms) / 1000
+        self.max_batch_size = max(1, max_batch_size)
+
+        self._pending = []  # [(message, history, future)]
+        self._timer = None
+
+        # Stats
+        self.batches = 0
+        self.batched_messages = 0
+        self.singles = 0
+        self.parse_failures = 0
+
+    async def submit(self, message: str, history: list = None) -> str:
+        """Queues `message` (with its chat's `history`, if any) for the next batch and waits for its reply."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((message, history, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: list):
+        messages = [message for message, _, _ in batch]
+        histories = [history for _, history, _ in batch]
+        try:
+            if len(batch) == 1:
+                self.singles += 1
+                replies = [await self.complete_single(messages[0], histories[0])]
+            else:
+                replies = await self.complete_batch(messages, histories)
+                if replies is None or len(replies) != len(batch):
+                    self.parse_failures += 1
+                    logger.warning(f"Batched completion for {len(batch)} messages could not be parsed; falling back to single calls.")
+                    self.singles += len(batch)
+                    replies = await asyncio.gather(*(
+                        self.complete_single(message, history) for message, history in zip(messages, histories)
+                    ))
+                else:
+                    self.batches += 1
+                    self.batched_messages += len(batch)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), reply in zip(batch, replies):
+            if not future.done():
+                future.set_result(reply)
+
+    def stats(self) -> dict:
+        """Returns how many replies were served by batched vs. single completions."""
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "batched_messages": self.batched_messages,
+            "avg_batch_size": round(self.batched_messages / self.batches, 2) if self.batches else 0.0,
+            "singles": self.singles,
+            "parse_failures": self.parse_failures,
+        }
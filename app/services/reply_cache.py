@@ -0,0 +1,109 @@
+import re
+import time
+import random
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# Runs of the same non-word character ("😭😭😭", "!!!", "???") collapse to one.
+_REPEATED_SYMBOL_RE = re.compile(r"([^\w\s])\1+")
+# Letters stretched for emphasis ("loool", "sooo") collapse to one, matching the plain spelling.
+_STRETCHED_LETTER_RE = re.compile(r"(\w)\1{2,}")
+# Emoji variation selectors and skin tone modifiers don't change the meaning.
+_EMOJI_MODIFIERS_RE = re.compile("[\ufe0e\ufe0f\U0001f3fb-\U0001f3ff]")
+
+
+def normalize_message(text: str) -> str:
+    """Builds the cache key for a chat message: case, whitespace and repeated emoji/letters are folded."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _EMOJI_MODIFIERS_RE.sub("", text)
+    text = _REPEATED_SYMBOL_RE.sub(r"\1", text)
+    text = _STRETCHED_LETTER_RE.sub(r"\1", text)
+    text = _WHITESPACE_RE.sub(" ", text)
+    return text.strip(" .!?,")
+
+
+class ReplyCache:
+    """
+    LRU + TTL cache of AI chat replies keyed on the normalized message.
+
+    Each key collects up to `variants` different replies before it starts serving
+    from the cache, and then picks one at random so repeated small talk doesn't
+    always get the identical answer. Messages longer than `max_key_length` after
+    normalization are never cached; they are rarely repeated.
+    """
+
+    def __init__(self, enabled: bool = True, max_keys: int = 2000, ttl_seconds: float = 3600,
+                 variants: int = 3, max_key_length: int = 80):
+        self.enabled = enabled
+        self.max_keys = max(1, max_keys)
+        self.ttl_seconds = ttl_seconds
+        self.variants = max(1, variants)
+        self.max_key_length = max_key_length
+
+        self._entries = OrderedDict()  # key -> (created_at, [replies])
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, message: str):
+        if not self.enabled:
+            return None
+        key = normalize_message(message)
+        if not key or len(key) > self.max_key_length:
+            return None
+        return key
+
+    def get(self, message: str):
+        """Returns a cached reply for `message`, or None if the key has not collected enough variants yet."""
+        key = self._key(message)
+        if key is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] >= self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None or len(entry[1]) < self.variants:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return random.choice(entry[1])
+
+    def add(self, message: str, reply: str):
+        """Stores a freshly generated reply as one of the variants for `message`."""
+        key = self._key(message)
+        if key is None:
+            return
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = (time.monotonic(), [])
+            if len(entry[1]) < self.variants and reply not in entry[1]:
+                entry[1].append(reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """Returns cache size and hit-rate counters."""
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "keys": len(self._entries),
+            "max_keys": self.max_keys,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+        }
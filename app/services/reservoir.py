@@ -0,0 +1,137 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class ContentReservoir:
+    """
+    Pool of pre-generated items (jokes, quotes) served instantly from memory.
+
+    `pop()` never waits on the network: it takes the next item from the pool and,
+    when the pool drops below `low_water`, starts a background refill that calls
+    `generate_batch(n)` until the pool is back at `capacity`. Items served in the
+    last `recent_window` pops are skipped so users don't see repeats. When the pool
+    is empty the `fallbacks` list is used instead.
+    """
+
+    def __init__(self, name: str, generate_batch, fallbacks: list, capacity: int = 20,
+                 low_water: int = 5, batch_size: int = 10, recent_window: int = 50,
+                 retry_delay: float = 60.0):
+        self.name = name
+        self.generate_batch = generate_batch
+        self.fallbacks = list(fallbacks)
+        self.capacity = max(1, capacity)
+        self.low_water = min(low_water, self.capacity)
+        self.batch_size = max(1, batch_size)
+        self.retry_delay = retry_delay
+
+        self._pool = deque()
+        self._recent = deque(maxlen=max(1, recent_window))
+        self._recent_keys = {}  # key -> occurrences in self._recent
+        self._lock = threading.Lock()
+        self._refilling = False
+        self._next_refill_at = 0.0
+
+        # Stats
+        self.served = 0
+        self.fallbacks_served = 0
+        self.generated = 0
+        self.refills = 0
+
+    def pop(self) -> str:
+        """Returns a pooled item (or a fallback if the pool is empty) and tops the pool up in the background."""
+        with self._lock:
+            item = self._pool.popleft() if self._pool else None
+            if item is None:
+                item = self._pick_fallback()
+                self.fallbacks_served += 1
+            else:
+                self.served += 1
+            self._mark_recent(item)
+            needs_refill = len(self._pool) < self.low_water
+
+        if needs_refill:
+            self.refill()
+        return item
+
+    def refill(self):
+        """Starts a background refill unless one is already running or a failed refill is backing off."""
+        with self._lock:
+            if self._refilling or time.monotonic() < self._next_refill_at:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, name=f"{self.name}-reservoir-refill", daemon=True).start()
+
+    def _refill(self):
+        self.refills += 1
+        try:
+            while True:
+                with self._lock:
+                    missing = self.capacity - len(self._pool)
+                if missing <= 0:
+                    break
+
+                batch = self.generate_batch(self.batch_size)
+                added = self._add(batch)
+                if added == 0:
+                    # The AI is failing or only returning repeats; try again later instead of spinning.
+                    self._next_refill_at = time.monotonic() + self.retry_delay
+                    logger.warning(f"{self.name} reservoir refill produced no new items; retrying in {self.retry_delay}s.")
+                    break
+        except Exception as e:
+            self._next_refill_at = time.monotonic() + self.retry_delay
+            logger.error(f"{self.name} reservoir refill failed: {e}")
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def _add(self, items: list) -> int:
+        added = 0
+        with self._lock:
+            pooled = {self._key(item) for item in self._pool}
+            for item in items:
+                key = self._key(item)
+                if not key or key in pooled or key in self._recent_keys:
+                    continue
+                if len(self._pool) >= self.capacity:
+                    break
+                self._pool.append(item)
+                pooled.add(key)
+                added += 1
+        self.generated += added
+        return added
+
+    def _pick_fallback(self) -> str:
+        fresh = [item for item in self.fallbacks if self._key(item) not in self._recent_keys]
+        return random.choice(fresh or self.fallbacks)
+
+    def _mark_recent(self, item: str):
+        if len(self._recent) == self._recent.maxlen:
+            oldest = self._key(self._recent[0])
+            if self._recent_keys[oldest] == 1:
+                del self._recent_keys[oldest]
+            else:
+                self._recent_keys[oldest] -= 1
+        self._recent.append(item)
+        key = self._key(item)
+        self._recent_keys[key] = self._recent_keys.get(key, 0) + 1
+
+    @staticmethod
+    def _key(item: str) -> str:
+        return " ".join(item.lower().split()) if item else ""
+
+    def stats(self) -> dict:
+        """Returns the pool level and how many pops were served from the pool vs. fallbacks."""
+        return {
+            "available": len(self._pool),
+            "capacity": self.capacity,
+            "served": self.served,
+            "fallbacks_served": self.fallbacks_served,
+            "generated": self.generated,
+            "refills": self.refills,
+            "refilling": self._refilling,
+        }
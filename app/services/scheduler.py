@@ -1,37 +1,336 @@
+import os
+import time
+import uuid
 import logging
+import threading
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.jobstores.base import JobLookupError
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED
+from .reminder_store import ReminderStore
+from .reminder_dispatch import ReminderDispatcher
+from .leader import LeaderLease
+from .metrics import REGISTRY
 
 logger = logging.getLogger(__name__)
 
+# --- Configuration ---
+REMINDER_DB_PATH = os.getenv("BOT_DB_PATH", "data/bot.db")
+# Only reminders due within this window are loaded into the scheduler; the rest stay on disk.
+REMINDER_HORIZON_SECONDS = float(os.getenv("REMINDER_HORIZON_SECONDS", "3600"))
+# Reminders missed while the bot was down are still sent if they are at most this late.
+REMINDER_CATCHUP_WINDOW_SECONDS = float(os.getenv("REMINDER_CATCHUP_WINDOW_SECONDS", "3600"))
+REMINDER_CATCHUP_BATCH_SIZE = int(os.getenv("REMINDER_CATCHUP_BATCH_SIZE", "100"))
+REMINDER_MISFIRE_GRACE_SECONDS = int(os.getenv("REMINDER_MISFIRE_GRACE_SECONDS", "300"))
+# Reminders firing within this window are delivered together (merged per recipient).
+REMINDER_COALESCE_WINDOW_SECONDS = float(os.getenv("REMINDER_COALESCE_WINDOW_SECONDS", "0.25"))
+SCHEDULER_MAX_WORKERS = int(os.getenv("SCHEDULER_MAX_WORKERS", "10"))
+# With several uvicorn/gunicorn workers, only the holder of this lease runs reminder jobs.
+SCHEDULER_LEADER_ELECTION = os.getenv("SCHEDULER_LEADER_ELECTION", "true").lower() in ("1", "true", "yes")
+SCHEDULER_LEASE_SECONDS = float(os.getenv("SCHEDULER_LEASE_SECONDS", "15"))
+# How often the leader picks up reminders that other workers added inside the loaded horizon.
+REMINDER_POLL_SECONDS = float(os.getenv("REMINDER_POLL_SECONDS", "5"))
+
+REMINDER_JOB_PREFIX = "reminder_"
+HORIZON_JOB_ID = "reminder_horizon_loader"
+RECOVERY_JOB_ID = "reminder_recovery"
+POLL_JOB_ID = "reminder_poll"
+LEASE_JOB_ID = "scheduler_lease_heartbeat"
+
+# Metrics: how late reminders are handed to delivery. path is "scheduled", "missed" (delivered
+# late after a skipped run) or "catch_up" (came due while the bot was down).
+REMINDER_LAG = REGISTRY.histogram(
+    "whatsapp_reminder_lag_seconds", "Reminder dispatch time minus scheduled fire time.", ("path",),
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 300, 900, 3600)
+)
+
 # Scheduler instance
-scheduler = BackgroundScheduler()
+scheduler = BackgroundScheduler(executors={"default": ThreadPoolExecutor(SCHEDULER_MAX_WORKERS)})
+
+# Jobs hand reminders to this stage instead of sending inline, so thread pool slots free up immediately.
+dispatcher = ReminderDispatcher(window=REMINDER_COALESCE_WINDOW_SECONDS)
+
+# Thread pool saturation and misfire counters, fed by scheduler events.
+_running_jobs = 0
+_peak_running_jobs = 0
+_missed_jobs = 0
+_stats_lock = threading.Lock()
+
+# Persistent reminder table, shared by every worker process
+store = ReminderStore(REMINDER_DB_PATH)
+
+# Leader election: any worker may add or clear reminders in the store, but only the leader schedules them.
+lease = LeaderLease(REMINDER_DB_PATH, name="reminder_scheduler", ttl=SCHEDULER_LEASE_SECONDS)
+_is_leader = False
+_leader_lock = threading.Lock()
+
+# Reminders due up to this epoch time have been loaded into the scheduler.
+_loaded_until = 0.0
+_last_poll_at = 0.0
+_horizon_lock = threading.Lock()
+
+# sender_id -> ids of that sender's reminders currently loaded as scheduler jobs (and the reverse),
+# so clearing and counting never scan the whole job list.
+_scheduled_by_sender = {}
+_scheduled_sender = {}
+# Number of reminder rows in the store, kept up to date on every add/deliver/clear.
+_pending_count = 0
+_index_lock = threading.Lock()
 
 # This is a placeholder for the function that sends the message.
 # It will be set from app.py to avoid circular imports.
 send_message_func = None
 
+def _on_job_event(event):
+    global _running_jobs, _peak_running_jobs, _missed_jobs
+    with _stats_lock:
+        if event.code == EVENT_JOB_SUBMITTED:
+            _running_jobs += 1
+            _peak_running_jobs = max(_peak_running_jobs, _running_jobs)
+        elif event.code in (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR):
+            # Not clamped: a fast job can report completion before its submission event arrives.
+            _running_jobs -= 1
+        elif event.code == EVENT_JOB_MISSED:
+            _missed_jobs += 1
+
+    if event.code == EVENT_JOB_MISSED and event.job_id.startswith(REMINDER_JOB_PREFIX):
+        # Skipped past its grace time (e.g. the pool was saturated): deliver late rather than lose it.
+        logger.warning(f"Reminder job {event.job_id} missed its run time; delivering late.")
+        reminder = _claim(event.job_id)
+        if reminder:
+            REMINDER_LAG.labels("missed").observe(max(0.0, time.time() - reminder["fire_at"]))
+            dispatcher.submit(reminder["sender_id"], reminder["message"])
+
+scheduler.add_listener(_on_job_event, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+
 def start_scheduler():
-    """Starts the background scheduler if it's not already running."""
+    """
+    Starts the background scheduler if it's not already running. With leader election on,
+    reminder jobs only start once this worker holds the lease; otherwise it leads immediately.
+    """
     if not scheduler.running:
         scheduler.start()
         logger.info("BackgroundScheduler started.")
+        if SCHEDULER_LEADER_ELECTION:
+            scheduler.add_job(
+                lease_heartbeat, 'interval',
+                seconds=max(1, SCHEDULER_LEASE_SECONDS / 3),
+                next_run_time=datetime.now(),
+                id=LEASE_JOB_ID, replace_existing=True
+            )
+        else:
+            _become_leader()
+
+def stop_scheduler(timeout: float = 5.0):
+    """
+    Stops the scheduler, hands the lease to another worker and flushes pending reminder deliveries.
+    Waits up to `timeout` for running jobs, so call it off the event loop the deliveries are sent on.
+    """
+    if scheduler.running:
+        # shutdown(wait=True) holds the job store lock while joining the pool, which deadlocks
+        # with jobs that add or remove jobs (lease heartbeat, horizon loader): pause and wait instead.
+        scheduler.pause()
+        deadline = time.monotonic() + timeout
+        while _running_jobs > 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        scheduler.shutdown(wait=False)
+        logger.info("BackgroundScheduler stopped.")
+    if _is_leader and SCHEDULER_LEADER_ELECTION:
+        lease.release()
+    dispatcher.flush()
+
+def lease_heartbeat():
+    """Renews or acquires the scheduler lease and starts/stops reminder jobs when leadership changes."""
+    held = lease.try_acquire()
+    if held and not _is_leader:
+        _become_leader()
+    elif not held and _is_leader:
+        _step_down()
+    _resync_pending_count()
+
+def _become_leader():
+    global _is_leader
+    with _leader_lock:
+        if _is_leader:
+            return
+        _is_leader = True
+    logger.info("This worker is now the reminder scheduler leader.")
+    # Recovery runs on the scheduler's thread pool so startup isn't blocked by catch-up sends.
+    scheduler.add_job(recover_reminders, id=RECOVERY_JOB_ID, replace_existing=True)
+    scheduler.add_job(
+        load_horizon, 'interval',
+        seconds=max(1, REMINDER_HORIZON_SECONDS / 2),
+        id=HORIZON_JOB_ID, replace_existing=True
+    )
+    if SCHEDULER_LEADER_ELECTION:
+        scheduler.add_job(
+            poll_new_reminders, 'interval',
+            seconds=max(1, REMINDER_POLL_SECONDS),
+            id=POLL_JOB_ID, replace_existing=True
+        )
+
+def _step_down():
+    """Drops every reminder job; the new leader reloads them from the store."""
+    global _is_leader, _loaded_until
+    with _leader_lock:
+        if not _is_leader:
+            return
+        _is_leader = False
+    logger.warning("This worker is no longer the reminder scheduler leader; unloading reminder jobs.")
+    for job_id in (HORIZON_JOB_ID, POLL_JOB_ID, RECOVERY_JOB_ID):
+        try:
+            scheduler.remove_job(job_id)
+        except JobLookupError:
+            pass
+    with _horizon_lock:
+        _loaded_until = 0.0
+        with _index_lock:
+            job_ids = list(_scheduled_sender)
+            _scheduled_by_sender.clear()
+            _scheduled_sender.clear()
+        for job_id in job_ids:
+            try:
+                scheduler.remove_job(job_id)
+            except JobLookupError:
+                pass
 
 def set_send_message_func(func):
     """Sets the function to send messages, injected from app.py."""
     global send_message_func
     send_message_func = func
+    dispatcher.set_sender(func)
+
+def _send_reminder(sender_id: str, message: str):
+    dispatcher.submit(sender_id, message)
+
+def _index_add(sender_id: str, reminder_id: str):
+    with _index_lock:
+        _scheduled_by_sender.setdefault(sender_id, set()).add(reminder_id)
+        _scheduled_sender[reminder_id] = sender_id
+
+def _index_discard(reminder_id: str):
+    with _index_lock:
+        sender_id = _scheduled_sender.pop(reminder_id, None)
+        ids = _scheduled_by_sender.get(sender_id)
+        if ids is not None:
+            ids.discard(reminder_id)
+            if not ids:
+                del _scheduled_by_sender[sender_id]
+
+def _resync_pending_count():
+    # Resync the counter with the store off the request path (other workers add and clear rows too).
+    global _pending_count
+    total = store.count()
+    with _index_lock:
+        _pending_count = total
+
+def _adjust_pending(delta: int):
+    global _pending_count
+    with _index_lock:
+        _pending_count = max(0, _pending_count + delta)
+
+def _claim(reminder_id: str):
+    reminder = store.claim(reminder_id)
+    _index_discard(reminder_id)
+    if reminder is not None:
+        _adjust_pending(-1)
+    return reminder
+
+def fire_reminder(reminder_id: str):
+    """
+    Job target for a scheduled reminder. Module-level (importable by reference) so jobs
+    only carry the reminder id; the message itself is read from the store.
+    """
+    reminder = _claim(reminder_id)
+    if reminder is None:
+        # Cleared (possibly by another worker), or already delivered by catch-up.
+        return
+    REMINDER_LAG.labels("scheduled").observe(max(0.0, time.time() - reminder["fire_at"]))
+    logger.info(f"Executing reminder {reminder['id']} for {reminder['sender_id']}.", extra={"category": "reminder"})
+    _send_reminder(reminder["sender_id"], reminder["message"])
+
+def _schedule(reminder: dict):
+    scheduler.add_job(
+        fire_reminder,
+        'date',
+        run_date=datetime.fromtimestamp(reminder["fire_at"]),
+        args=[reminder["id"]],
+        id=reminder["id"],
+        misfire_grace_time=REMINDER_MISFIRE_GRACE_SECONDS,
+        replace_existing=True
+    )
+    _index_add(reminder["sender_id"], reminder["id"])
+
+def load_horizon():
+    """Schedules stored reminders that fall due before now + REMINDER_HORIZON_SECONDS."""
+    global _loaded_until
+    _resync_pending_count()
+    with _horizon_lock:
+        if not _is_leader:
+            return
+        until = time.time() + REMINDER_HORIZON_SECONDS
+        upcoming = store.due_between(_loaded_until, until)
+        for reminder in upcoming:
+            _schedule(reminder)
+        _loaded_until = until
+    if upcoming:
+        logger.info(f"Loaded {len(upcoming)} reminders due in the next {int(REMINDER_HORIZON_SECONDS)}s.")
+
+def poll_new_reminders():
+    """Leader only: schedules reminders other workers added since the last poll that fall inside the loaded horizon."""
+    global _last_poll_at
+    with _horizon_lock:
+        if not _is_leader:
+            return
+        # Overlap the window slightly so rows committed around the previous poll aren't missed.
+        since = _last_poll_at - REMINDER_POLL_SECONDS
+        _last_poll_at = time.time()
+        new_reminders = store.created_since(since, _loaded_until)
+        for reminder in new_reminders:
+            if reminder["id"] not in _scheduled_sender:
+                _schedule(reminder)
+
+def catch_up_misfires():
+    """Delivers reminders that came due while the bot was down, in batches, and drops ones that are too old."""
+    now = time.time()
+    expired = store.delete_before(now - REMINDER_CATCHUP_WINDOW_SECONDS)
+    _adjust_pending(-expired)
+    if expired:
+        logger.warning(f"Dropped {expired} reminders that were more than {int(REMINDER_CATCHUP_WINDOW_SECONDS)}s overdue.")
+
+    delivered = 0
+    while True:
+        batch = store.due_between(0, now, limit=REMINDER_CATCHUP_BATCH_SIZE)
+        if not batch:
+            break
+        for reminder in batch:
+            claimed = _claim(reminder["id"])
+            if claimed:
+                REMINDER_LAG.labels("catch_up").observe(max(0.0, time.time() - claimed["fire_at"]))
+                _send_reminder(claimed["sender_id"], claimed["message"])
+                delivered += 1
+    if delivered:
+        logger.info(f"Caught up {delivered} missed reminders.")
+
+def recover_reminders():
+    """Restart recovery: catch up missed reminders, then load the upcoming horizon."""
+    global _loaded_until, _last_poll_at
+    with _horizon_lock:
+        _loaded_until = time.time()
+        _last_poll_at = _loaded_until
+    catch_up_misfires()
+    load_horizon()
 
 def add_reminder(sender_id: str, time_str: str, message: str) -> str:
     """
-    Adds a reminder job to the scheduler.
+    Adds a reminder to the persistent store, scheduling it now if it falls within the horizon.
     time_str can be '10m' (minutes) or '1h' (hours).
     """
-    
+
     time_str = time_str.lower().strip()
     delay_seconds = 0
-    
+
     try:
         if time_str.endswith('m'):
             minutes = int(time_str[:-1])
@@ -41,31 +340,27 @@ def add_reminder(sender_id: str, time_str: str, message: str) -> str:
             delay_seconds = hours * 3600
         else:
             return "⚠️ Invalid time format. Use '10m' for 10 minutes or '1h' for 1 hour."
-            
+
         if delay_seconds <= 0:
             return "⚠️ Reminder time must be in the future."
 
         run_date = datetime.now() + timedelta(seconds=delay_seconds)
-        
-        # Define the job function that will be executed
-        def reminder_job():
-            logger.info(f"Executing reminder for {sender_id}: {message}")
-            if send_message_func:
-                reminder_text = f"🔔 *REMINDER* 🔔\n\n**From HOC/Asst HOC:**\n{message}"
-                send_message_func(sender_id, reminder_text)
-            else:
-                logger.error("send_message_func not set in scheduler.py")
-
-        # Add the job
-        job = scheduler.add_job(
-            reminder_job, 
-            'date', 
-            run_date=run_date, 
-            id=f"reminder_{sender_id}_{run_date.timestamp()}",
-            misfire_grace_time=300 # 5 minutes grace time
-        )
-        
-        logger.info(f"Reminder set for {sender_id} at {run_date.strftime('%Y-%m-%d %H:%M:%S')}. Job ID: {job.id}")
+        reminder = {
+            "id": f"{REMINDER_JOB_PREFIX}{sender_id}_{uuid.uuid4().hex[:12]}",
+            "sender_id": sender_id,
+            "message": message,
+            "fire_at": run_date.timestamp(),
+        }
+
+        # Persist first so the reminder survives a restart, then schedule it if it's within the loaded horizon.
+        with _horizon_lock:
+            store.add(reminder["id"], sender_id, message, reminder["fire_at"])
+            _adjust_pending(1)
+            # On a non-leader _loaded_until is 0: the leader picks the row up from the store.
+            if _is_leader and reminder["fire_at"] <= _loaded_until:
+                _schedule(reminder)
+
+        logger.info(f"Reminder set for {sender_id} at {run_date.strftime('%Y-%m-%d %H:%M:%S')}. Job ID: {reminder['id']}")
         return f"✅ Reminder set! I will send the message in {time_str} at {run_date.strftime('%I:%M %p')}."
 
     except ValueError:
@@ -75,37 +370,76 @@ def add_reminder(sender_id: str, time_str: str, message: str) -> str:
         return "❌ An error occurred while setting the reminder."
 
 def clear_reminders(sender_id: str) -> str:
-    """Clears all scheduled reminders for the given sender_id (or all if not specified)."""
-    
-    jobs_cleared = 0
-    for job in scheduler.get_jobs():
-        # A simple check to see if the job ID contains the sender's ID (based on how we create the ID)
-        if f"reminder_{sender_id}" in job.id:
-            try:
-                scheduler.remove_job(job.id)
-                jobs_cleared += 1
-            except JobLookupError:
-                # Should not happen, but good to handle
-                logger.warning(f"Attempted to clear non-existent job: {job.id}")
-            except Exception as e:
-                logger.error(f"Error removing job {job.id}: {e}")
-                
+    """Clears all scheduled reminders for the given sender_id. O(k) in that sender's reminders."""
+
+    reminder_ids = store.delete_for_sender(sender_id)
+    _adjust_pending(-len(reminder_ids))
+
+    with _index_lock:
+        scheduled_ids = _scheduled_by_sender.pop(sender_id, set())
+        for reminder_id in scheduled_ids:
+            _scheduled_sender.pop(reminder_id, None)
+
+    for reminder_id in scheduled_ids:
+        try:
+            scheduler.remove_job(reminder_id)
+        except JobLookupError:
+            # Already fired between the delete and now
+            pass
+        except Exception as e:
+            logger.error(f"Error removing job {reminder_id}: {e}")
+
+    jobs_cleared = len(reminder_ids)
     if jobs_cleared > 0:
         logger.info(f"Cleared {jobs_cleared} reminders for {sender_id}.")
         return f"✅ Cleared {jobs_cleared} scheduled reminders."
     else:
         return "ℹ️ No active reminders found to clear."
 
-def get_active_reminders() -> list:
-    """Returns a list of all active jobs for logging/debugging."""
-    jobs = []
-    for job in scheduler.get_jobs():
-        jobs.append({
-            "id": job.id,
-            "next_run": job.next_run_time.strftime('%Y-%m-%d %H:%M:%S') if job.next_run_time else "None",
-            "trigger": str(job.trigger)
-        })
-    return jobs
-
-# Start the scheduler when this module is imported
-start_scheduler()
+def list_reminders(sender_id: str = None, after: float = None, before: float = None,
+                   cursor: str = None, limit: int = 50) -> dict:
+    """
+    Returns one page of stored reminders, earliest first, with an opaque cursor for the next page.
+    Filters: exact sender_id, and fire time in [after, before) as epoch seconds.
+    """
+    after_key = None
+    if cursor:
+        fire_at, _, reminder_id = cursor.partition(":")
+        after_key = (float(fire_at), reminder_id)
+
+    rows = store.find(sender_id=sender_id, after=after, before=before, cursor=after_key, limit=limit + 1)
+    page = rows[:limit]
+    with _index_lock:
+        items = [{
+            "id": row["id"],
+            "sender_id": row["sender_id"],
+            "message": row["message"],
+            "fire_at": datetime.fromtimestamp(row["fire_at"]).strftime('%Y-%m-%d %H:%M:%S'),
+            "scheduled": row["id"] in _scheduled_sender,
+        } for row in page]
+
+    next_cursor = f"{page[-1]['fire_at']!r}:{page[-1]['id']}" if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+def get_scheduler_stats() -> dict:
+    """Returns thread pool saturation, skipped-misfire and coalescing counters."""
+    with _stats_lock:
+        running = max(0, _running_jobs)
+        return {
+            "running_jobs": running,
+            "max_workers": SCHEDULER_MAX_WORKERS,
+            "saturation": round(running / SCHEDULER_MAX_WORKERS, 2),
+            "peak_running_jobs": _peak_running_jobs,
+            "missed_jobs": _missed_jobs,
+            "is_leader": _is_leader,
+            "lease": lease.stats() if SCHEDULER_LEADER_ELECTION else None,
+            "delivery": dispatcher.stats(),
+        }
+
+def get_reminder_counts() -> dict:
+    """Returns reminder counts in constant time (no job or table scan), for /health."""
+    return {
+        "pending": _pending_count,
+        "scheduled": len(_scheduled_sender),
+        "senders_scheduled": len(_scheduled_by_sender),
+    }
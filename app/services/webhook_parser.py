@@ -0,0 +1,55 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# orjson decodes webhook bodies several times faster than the stdlib, but is optional.
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+def loads(body: bytes):
+    """Decodes a raw JSON request body. Raises ValueError if it isn't valid JSON."""
+    if ORJSON_AVAILABLE:
+        # orjson.JSONDecodeError subclasses ValueError, like json.JSONDecodeError
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def split_events(payload) -> tuple:
+    """
+    Walks a decoded webhook payload with plain dict lookups and returns (has_messages, statuses).
+
+    `statuses` are the raw receipt dicts from every "messages" change. This is all a
+    receipt-only delivery needs, so callers only validate the payload into models when
+    `has_messages` is true. Malformed parts are skipped rather than raising.
+    """
+    has_messages = False
+    statuses = []
+    if not isinstance(payload, dict):
+        return has_messages, statuses
+    entries = payload.get("entry")
+    if not isinstance(entries, list):
+        return has_messages, statuses
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        changes = entry.get("changes")
+        if not isinstance(changes, list):
+            continue
+        for change in changes:
+            if not isinstance(change, dict) or change.get("field") != "messages":
+                continue
+            value = change.get("value")
+            if not isinstance(value, dict):
+                continue
+            if value.get("messages"):
+                has_messages = True
+            change_statuses = value.get("statuses")
+            if isinstance(change_statuses, list):
+                statuses.extend(s for s in change_statuses if isinstance(s, dict))
+    return has_messages, statuses
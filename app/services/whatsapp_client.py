@@ -0,0 +1,178 @@
+import os
+import time
+import importlib.util
+import logging
+import httpx
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+GRAPH_API_VERSION = os.getenv("GRAPH_API_VERSION", "v19.0")
+# Overridable so benchmarks can point the bot at a local stand-in (see bench/fake_services.py).
+GRAPH_API_BASE_URL = os.getenv("GRAPH_API_BASE_URL", "https://graph.facebook.com").rstrip("/")
+CONNECT_TIMEOUT = float(os.getenv("WHATSAPP_CONNECT_TIMEOUT", "3.0"))
+READ_TIMEOUT = float(os.getenv("WHATSAPP_READ_TIMEOUT", "10.0"))
+MAX_CONNECTIONS = int(os.getenv("WHATSAPP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("WHATSAPP_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("WHATSAPP_KEEPALIVE_EXPIRY", "30.0"))
+
+# HTTP/2 multiplexes concurrent sends over one connection, but needs the optional `h2` package.
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Metrics
+SEND_SECONDS = REGISTRY.histogram("whatsapp_graph_send_seconds", "Graph API send latency.", ("outcome",))
+SEND_ERRORS = REGISTRY.counter("whatsapp_graph_send_errors", "Failed Graph API sends by HTTP status and Graph error code.", ("status", "code"))
+
+# Credentials are injected from main.py after the .env file is loaded.
+_token = None
+_phone_number_id = None
+
+# Shared client. It belongs to the event loop that created it.
+_async_client = None
+
+
+class WhatsAppSendError(Exception):
+    """Raised when the Graph API rejects a message or cannot be reached."""
+
+    def __init__(self, message: str, status_code: int = None, retry_after: float = None, error_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.error_code = error_code  # Graph API error code from the response body, e.g. 131026
+
+    @property
+    def transient(self) -> bool:
+        """Network errors, rate limits and 5xx responses are worth retrying."""
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+def configure(token: str, phone_number_id: str):
+    """Sets the credentials used for every outbound request, injected from main.py."""
+    global _token, _phone_number_id
+    _token = token
+    _phone_number_id = phone_number_id
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def _messages_url() -> str:
+    return f"{GRAPH_API_BASE_URL}/{GRAPH_API_VERSION}/{_phone_number_id}/messages"
+
+
+def _headers() -> dict:
+    return {
+        "Authorization": f"Bearer {_token}",
+        "Content-Type": "application/json",
+    }
+
+
+def _build_payload(recipient_id: str, message_body: str, message_type: str) -> dict:
+    # Note: WhatsApp Cloud API uses 'individual' for both individual and group chats.
+    return {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": recipient_id,
+        "type": message_type,
+        "text": {"body": message_body}
+    }
+
+
+def _parse_retry_after(response: httpx.Response):
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _parse_error_code(response: httpx.Response):
+    try:
+        return response.json()["error"]["code"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _check_response(response: httpx.Response) -> dict:
+    if response.status_code >= 400:
+        raise WhatsAppSendError(
+            f"Graph API returned {response.status_code}: {response.text[:200]}",
+            status_code=response.status_code,
+            retry_after=_parse_retry_after(response),
+            error_code=_parse_error_code(response),
+        )
+    try:
+        return response.json()
+    except ValueError:
+        return {}
+
+
+def _record_send(started: float, error: WhatsAppSendError = None):
+    SEND_SECONDS.labels("error" if error else "ok").observe(time.perf_counter() - started)
+    if error is not None:
+        status = "network" if error.status_code is None else str(error.status_code)
+        SEND_ERRORS.labels(status, "" if error.error_code is None else str(error.error_code)).inc()
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Returns the pooled async client, creating it on the running loop if needed."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=_timeout(),
+            limits=_limits(),
+        )
+        logger.info(f"WhatsApp async client created (http2={HTTP2_AVAILABLE}, max_connections={MAX_CONNECTIONS}).")
+    return _async_client
+
+
+async def start():
+    """Binds the shared client to the running event loop. Call from the app lifespan."""
+    _get_async_client()
+
+
+async def close():
+    """Closes the pooled client, waiting for in-flight requests to finish."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def send_message(recipient_id: str, message_body: str, message_type: str = "text") -> dict:
+    """
+    Sends a message over the pooled async client and returns the Graph API response.
+    Raises WhatsAppSendError on HTTP or network failures.
+    """
+    if not _token or not _phone_number_id:
+        raise WhatsAppSendError("WHATSAPP_TOKEN or PHONE_NUMBER_ID is missing.", status_code=0)
+
+    client = _get_async_client()
+    started = time.perf_counter()
+    try:
+        try:
+            response = await client.post(
+                _messages_url(),
+                headers=_headers(),
+                json=_build_payload(recipient_id, message_body, message_type),
+            )
+        except httpx.HTTPError as e:
+            raise WhatsAppSendError(f"Request to Graph API failed: {e!r}") from e
+        result = _check_response(response)
+    except WhatsAppSendError as e:
+        _record_send(started, e)
+        raise
+    _record_send(started)
+    return result
+
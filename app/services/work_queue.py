@@ -0,0 +1,152 @@
+import time
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+FULL_POLICY_SHED = "shed"
+FULL_POLICY_BLOCK = "block"
+
+
+class WorkQueue:
+    """
+    Bounded in-process job queue drained by a pool of async workers.
+
+    Jobs are grouped by key (the WhatsApp sender id): jobs for the same key run
+    one at a time in submission order, while different keys run concurrently.
+    Only keys with pending work sit in the ready queue, so a busy sender never
+    blocks the others.
+    """
+
+    def __init__(self, worker_count: int = 8, max_size: int = 1000,
+                 full_policy: str = FULL_POLICY_BLOCK, block_timeout: float = 0.5):
+        self.worker_count = max(1, worker_count)
+        self.max_size = max(1, max_size)
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+
+        self._pending = {}  # key -> deque of (enqueued_at, func, args)
+        self._ready = None
+        self._workers = []
+        self._size = 0
+        self._accepting = False
+        self._space = None
+        self._idle = None
+
+        # Stats
+        self._enqueued = 0
+        self._processed = 0
+        self._failed = 0
+        self._shed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_last = 0.0
+
+    async def start(self):
+        """Starts the worker tasks on the running event loop."""
+        if self._workers:
+            return
+        self._ready = asyncio.Queue()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._accepting = True
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"work-queue-{i}")
+            for i in range(self.worker_count)
+        ]
+        logger.info(f"WorkQueue started with {self.worker_count} workers (max_size={self.max_size}, policy={self.full_policy}).")
+
+    async def stop(self, timeout: float = 10.0):
+        """Stops accepting work, waits up to `timeout` for queued jobs to finish, then cancels the workers."""
+        self._accepting = False
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"WorkQueue drain timed out with {self._size} jobs still pending.")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("WorkQueue stopped.")
+
+    async def submit(self, key: str, func, *args) -> bool:
+        """
+        Queues `await func(*args)` behind any earlier jobs for `key`.
+        Returns False if the queue is full (after waiting, for the block policy) or shutting down.
+        """
+        if not self._accepting:
+            return False
+
+        if self._size >= self.max_size:
+            if self.full_policy == FULL_POLICY_BLOCK:
+                try:
+                    while self._size >= self.max_size:
+                        self._space.clear()
+                        await asyncio.wait_for(self._space.wait(), timeout=self.block_timeout)
+                except asyncio.TimeoutError:
+                    pass
+            if self._size >= self.max_size or not self._accepting:
+                self._shed += 1
+                logger.warning(f"WorkQueue full ({self._size}/{self.max_size}); shedding job for {key}.")
+                return False
+
+        items = self._pending.get(key)
+        if items is None:
+            items = self._pending[key] = deque()
+            self._ready.put_nowait(key)
+        items.append((time.monotonic(), func, args))
+
+        self._size += 1
+        self._enqueued += 1
+        self._idle.clear()
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            items = self._pending[key]
+            enqueued_at, func, args = items.popleft()
+
+            wait = time.monotonic() - enqueued_at
+            self._wait_last = wait
+            self._wait_total += wait
+            if wait > self._wait_max:
+                self._wait_max = wait
+
+            try:
+                await func(*args)
+            except Exception as e:
+                self._failed += 1
+                logger.error(f"Error processing queued job for {key}: {e}")
+            finally:
+                self._processed += 1
+                self._size -= 1
+                if items:
+                    # Re-queue the key behind other senders so one chatty sender can't starve them.
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+                self._space.set()
+                if self._size == 0:
+                    self._idle.set()
+
+    def stats(self) -> dict:
+        """Returns queue depth, throughput counters and queue wait times (in milliseconds)."""
+        return {
+            "depth": self._size,
+            "max_size": self.max_size,
+            "active_senders": len(self._pending),
+            "workers": len(self._workers),
+            "enqueued": self._enqueued,
+            "processed": self._processed,
+            "failed": self._failed,
+            "shed": self._shed,
+            "wait_ms_last": round(self._wait_last * 1000, 2),
+            "wait_ms_avg": round(self._wait_total / self._processed * 1000, 2) if self._processed else 0.0,
+            "wait_ms_max": round(self._wait_max * 1000, 2),
+        }
@@ -0,0 +1,173 @@
+"""
+Local stand-ins for the WhatsApp Graph API and the OpenAI chat completions API, for
+offline benchmarks. Both are served by one process:
+
+    POST /{version}/{phone_number_id}/messages   Graph API send
+    POST /v1/chat/completions                    OpenAI chat completion
+    GET  /_stats                                 sends received per recipient (arrival times)
+    POST /_reset                                 clears the recorded sends
+
+Point the bot at it with GRAPH_API_BASE_URL=http://127.0.0.1:<port> and
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1. Latency and errors are injected per call:
+
+    python bench/fake_services.py --port 9100 --graph-latency-ms 80 --graph-error-rate 0.02 \\
+        --graph-429-rate 0.01 --openai-latency-ms 600 --openai-error-rate 0.01
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+class FaultProfile:
+    """Latency (mean +/- uniform jitter) and error injection for one fake dependency."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, retry_after: float = 1.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+
+    async def delay(self):
+        latency = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+    def fault(self):
+        """Returns "rate_limit", "error" or None for this call."""
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            return "rate_limit"
+        if roll < self.rate_limit_rate + self.error_rate:
+            return "error"
+        return None
+
+
+graph = FaultProfile(
+    latency_ms=_env_float("FAKE_GRAPH_LATENCY_MS", 50),
+    jitter_ms=_env_float("FAKE_GRAPH_JITTER_MS", 20),
+    error_rate=_env_float("FAKE_GRAPH_ERROR_RATE", 0),
+    rate_limit_rate=_env_float("FAKE_GRAPH_429_RATE", 0),
+)
+openai = FaultProfile(
+    latency_ms=_env_float("FAKE_OPENAI_LATENCY_MS", 500),
+    jitter_ms=_env_float("FAKE_OPENAI_JITTER_MS", 200),
+    error_rate=_env_float("FAKE_OPENAI_ERROR_RATE", 0),
+    rate_limit_rate=_env_float("FAKE_OPENAI_429_RATE", 0),
+)
+
+# recipient_id -> arrival times (epoch seconds) of messages sent to it
+_sends = {}
+
+app = FastAPI(title="Fake Graph API + OpenAI")
+
+
+@app.post("/{version}/{phone_number_id}/messages")
+async def graph_send(version: str, phone_number_id: str, request: Request):
+    payload = await request.json()
+    await graph.delay()
+    fault = graph.fault()
+    if fault == "rate_limit":
+        return JSONResponse(
+            {"error": {"message": "(#130429) Rate limit hit", "type": "OAuthException", "code": 130429}},
+            status_code=429, headers={"Retry-After": str(graph.retry_after)}
+        )
+    if fault == "error":
+        return JSONResponse(
+            {"error": {"message": "Service temporarily unavailable", "type": "OAuthException", "code": 2}},
+            status_code=503
+        )
+    _sends.setdefault(payload.get("to"), []).append(time.time())
+    return {
+        "messaging_product": "whatsapp",
+        "contacts": [{"input": payload.get("to"), "wa_id": payload.get("to")}],
+        "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}],
+    }
+
+
+def _completion_text(messages: list) -> str:
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    if "JSON array" in system:
+        # Batch prompts: reservoir refills ("Give me 10 ...") and batched chat replies ("exactly 4 reply strings")
+        match = re.search(r"exactly (\d+)", system) or re.search(r"Give me (\d+)", user)
+        count = int(match.group(1)) if match else 1
+        return json.dumps([f"Synthetic item {i} {uuid.uuid4().hex[:6]} 😂" for i in range(count)])
+    return "Synthetic reply: hang in there, the weekend is only a few slides away! 😅"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await openai.delay()
+    fault = openai.fault()
+    if fault == "rate_limit":
+        return JSONResponse({"error": {"message": "Rate limit reached", "type": "requests"}}, status_code=429)
+    if fault == "error":
+        return JSONResponse({"error": {"message": "The server had an error", "type": "server_error"}}, status_code=500)
+    text = _completion_text(body.get("messages", []))
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+    completion_tokens = len(text) // 4
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+@app.get("/_stats")
+async def stats():
+    return {"sends": _sends}
+
+
+@app.post("/_reset")
+async def reset():
+    _sends.clear()
+    return {"status": "ok"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--graph-latency-ms", type=float, default=graph.latency_ms)
+    parser.add_argument("--graph-jitter-ms", type=float, default=graph.jitter_ms)
+    parser.add_argument("--graph-error-rate", type=float, default=graph.error_rate)
+    parser.add_argument("--graph-429-rate", type=float, default=graph.rate_limit_rate)
+    parser.add_argument("--openai-latency-ms", type=float, default=openai.latency_ms)
+    parser.add_argument("--openai-jitter-ms", type=float, default=openai.jitter_ms)
+    parser.add_argument("--openai-error-rate", type=float, default=openai.error_rate)
+    parser.add_argument("--openai-429-rate", type=float, default=openai.rate_limit_rate)
+    args = parser.parse_args()
+
+    graph.latency_ms, graph.jitter_ms = args.graph_latency_ms, args.graph_jitter_ms
+    graph.error_rate, graph.rate_limit_rate = args.graph_error_rate, args.graph_429_rate
+    openai.latency_ms, openai.jitter_ms = args.openai_latency_ms, args.openai_jitter_ms
+    openai.error_rate, openai.rate_limit_rate = args.openai_error_rate, args.openai_429_rate
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
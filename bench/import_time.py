@@ -0,0 +1,110 @@
+"""
+Cold-start budget check: how long a fresh process takes to import the app and to
+finish its lifespan startup (i.e. be ready to accept webhooks).
+
+Each measurement runs in a new interpreter so nothing is already imported.
+Exits non-zero if the median of the runs is over budget.
+
+    python bench/import_time.py --runs 5 --import-budget-ms 800 --startup-budget-ms 1000
+    python bench/import_time.py --profile   # per-module breakdown (python -X importtime)
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter: prints timings and the threads alive right after import as JSON.
+CHILD = r"""
+import json, time, asyncio, threading
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+threads_after_import = sorted(t.name for t in threading.enumerate() if t is not threading.main_thread())
+
+async def startup():
+    async with app.main.lifespan(app.main.app):
+        ready = time.perf_counter()
+    return ready, time.perf_counter() - ready
+
+ready, shutdown = asyncio.run(startup())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - started) * 1000,
+    "shutdown_ms": shutdown * 1000,
+    "threads_after_import": threads_after_import,
+}))
+"""
+
+
+def run_once(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def profile(env: dict, top: int):
+    """Prints the slowest modules by cumulative import time."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), module.rstrip()))
+    for cumulative, module in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:9.1f} ms  {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "800")))
+    parser.add_argument("--startup-budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "1000")))
+    parser.add_argument("--profile", action="store_true", help="show the slowest imports instead")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    # Keep the measurement away from real credentials and the real database.
+    tmp = tempfile.mkdtemp(prefix="import-bench-")
+    env = dict(os.environ, BOT_DB_PATH=os.path.join(tmp, "bot.db"), OPENAI_API_KEY="", WHATSAPP_TOKEN="")
+
+    if args.profile:
+        profile(env, args.top)
+        return 0
+
+    results = [run_once(env) for _ in range(args.runs)]
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    startup_ms = statistics.median(r["startup_ms"] for r in results)
+    shutdown_ms = statistics.median(r["shutdown_ms"] for r in results)
+    threads = results[-1]["threads_after_import"]
+
+    print(f"import   p50 {import_ms:7.1f} ms  (budget {args.import_budget_ms:.0f} ms)")
+    print(f"ready    p50 {startup_ms:7.1f} ms  (budget {args.startup_budget_ms:.0f} ms)")
+    print(f"shutdown p50 {shutdown_ms:7.1f} ms")
+    print(f"threads started by import: {threads or 'none'}")
+
+    failed = False
+    if import_ms > args.import_budget_ms:
+        print("FAIL: import is over budget (run with --profile to see why)")
+        failed = True
+    if startup_ms > args.startup_budget_ms:
+        print("FAIL: startup is over budget")
+        failed = True
+    if threads:
+        print("FAIL: importing the app started background threads")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
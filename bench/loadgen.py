@@ -0,0 +1,396 @@
+"""
+Offline load test: replays synthetic WhatsApp webhook traffic against the bot and reports
+throughput and p50/p95/p99 latency per path. The bot talks to bench/fake_services.py
+instead of Meta and OpenAI.
+
+Scenarios (each sent open-loop at its own rate):
+  command   one "/joke", "/quote" or "/help" message per POST
+  chat      one chat message per POST (AI reply)
+  receipts  a flood of delivery/read receipts per POST (STATUS_FLOOD_SIZE each)
+  batched   several senders' messages in one POST (BATCH_SIZE each)
+
+Two latencies are reported: the webhook's own response time, and for message scenarios
+the time until the fake Graph API receives the bot's reply (end-to-end).
+
+    python bench/loadgen.py --duration 20 --rate command=40 --rate chat=20 --rate receipts=100 --rate batched=5
+    python bench/loadgen.py --save-baseline bench/baseline.json
+    python bench/loadgen.py --compare bench/baseline.json --tolerance 0.25    # exits 1 on regression
+
+By default the fake services and the bot are started as subprocesses on free ports
+(with a throwaway database); pass --bot-url/--fake-url to target running instances.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATUS_FLOOD_SIZE = 20
+BATCH_SIZE = 5
+MIN_P95_SAMPLES = 100
+DEFAULT_RATES = {"command": 10, "chat": 5, "receipts": 20, "batched": 2}
+COMMANDS = ["/joke", "/quote", "/help"]
+# A few repeated phrases (like real small talk) plus unique ones
+CHAT_PHRASES = ["lol", "when is the test", "this lecturer no dey play", "I'm so tired"]
+
+
+# --- Synthetic payloads ---
+
+def _delivery(messages: list = (), statuses: list = ()) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "102290129340398",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15550783881", "phone_number_id": "bench"},
+                    "messages": list(messages),
+                    "statuses": list(statuses),
+                },
+            }],
+        }],
+    }
+
+
+def _text_message(sender_id: str, seq: int, body: str) -> dict:
+    return {
+        "from": sender_id,
+        "id": f"wamid.bench.{sender_id}.{seq}",
+        "timestamp": str(int(time.time())),
+        "type": "text",
+        "text": {"body": body},
+    }
+
+
+def _status(seq: int, status: str) -> dict:
+    return {
+        "id": f"wamid.bench.out.{seq}",
+        "status": status,
+        "timestamp": str(int(time.time())),
+        "recipient_id": f"234800{seq % 100000:06d}",
+    }
+
+
+class Scenario:
+    """Builds payloads for one traffic type. Each message gets a fresh sender id so replies can be matched."""
+
+    def __init__(self, name: str, index: int):
+        self.name = name
+        self.index = index
+        self.seq = 0
+
+    def _sender(self) -> str:
+        self.seq += 1
+        return f"9{self.index}{self.seq:09d}"
+
+    def build(self) -> tuple:
+        """Returns (payload, [sender ids expecting a reply])."""
+        if self.name == "command":
+            sender = self._sender()
+            return _delivery([_text_message(sender, self.seq, COMMANDS[self.seq % len(COMMANDS)])]), [sender]
+        if self.name == "chat":
+            sender = self._sender()
+            body = CHAT_PHRASES[self.seq % len(CHAT_PHRASES)] if self.seq % 2 else f"random thought number {self.seq}"
+            return _delivery([_text_message(sender, self.seq, body)]), [sender]
+        if self.name == "receipts":
+            self.seq += 1
+            statuses = [_status(self.seq * STATUS_FLOOD_SIZE + i, ("sent", "delivered", "read")[i % 3])
+                        for i in range(STATUS_FLOOD_SIZE)]
+            return _delivery(statuses=statuses), []
+        if self.name == "batched":
+            senders = [self._sender() for _ in range(BATCH_SIZE)]
+            messages = [_text_message(s, self.seq, COMMANDS[i % len(COMMANDS)]) for i, s in enumerate(senders)]
+            return _delivery(messages), senders
+        raise ValueError(f"Unknown scenario {self.name}")
+
+
+# --- Measurement ---
+
+def percentile(values: list, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return round(ordered[rank], 2)
+
+
+def summarize(values: list) -> dict:
+    return {"n": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99)}
+
+
+async def run_load(bot_url: str, fake_url: str, rates: dict, duration: float, drain: float) -> dict:
+    results = {name: {"sent_at": {}, "webhook_ms": [], "errors": 0, "requests": 0} for name in rates}
+    limits = httpx.Limits(max_connections=200, max_keepalive_connections=200)
+    async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+        await client.post(f"{fake_url}/_reset")
+        pending = set()
+
+        async def fire(scenario: Scenario):
+            payload, expecting = scenario.build()
+            body = json.dumps(payload).encode()
+            result = results[scenario.name]
+            started = time.time()
+            for sender in expecting:
+                result["sent_at"][sender] = started
+            try:
+                response = await client.post(f"{bot_url}/webhook", content=body,
+                                             headers={"Content-Type": "application/json"})
+                if response.status_code != 200:
+                    result["errors"] += 1
+            except httpx.HTTPError:
+                result["errors"] += 1
+            result["requests"] += 1
+            result["webhook_ms"].append((time.time() - started) * 1000)
+
+        async def drive(scenario: Scenario, rate: float):
+            # Open loop: requests go out on schedule whether or not earlier ones have finished.
+            interval = 1.0 / rate
+            next_at = time.monotonic()
+            deadline = next_at + duration
+            while next_at < deadline:
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.create_task(fire(scenario))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                next_at += interval
+
+        started = time.monotonic()
+        await asyncio.gather(*(
+            drive(Scenario(name, i), rate) for i, (name, rate) in enumerate(rates.items()) if rate > 0
+        ))
+        if pending:
+            await asyncio.gather(*pending)
+        elapsed = time.monotonic() - started
+
+        # Wait for the bot's replies to reach the fake Graph API.
+        expected = sum(len(r["sent_at"]) for r in results.values())
+        drain_deadline = time.monotonic() + drain
+        while True:
+            sends = (await client.get(f"{fake_url}/_stats")).json()["sends"]
+            received = sum(1 for r in results.values() for sender in r["sent_at"] if sender in sends)
+            if received >= expected or time.monotonic() > drain_deadline:
+                break
+            await asyncio.sleep(0.5)
+
+    report = {"duration_s": round(elapsed, 2), "scenarios": {}}
+    for name, result in results.items():
+        reply_ms = []
+        for sender, sent_at in result["sent_at"].items():
+            arrivals = [t for t in sends.get(sender, ()) if t >= sent_at]
+            if arrivals:
+                reply_ms.append((min(arrivals) - sent_at) * 1000)
+        entry = {
+            "requests": result["requests"],
+            "errors": result["errors"],
+            "throughput_rps": round(result["requests"] / elapsed, 2) if elapsed else 0.0,
+            "webhook_ms": summarize(result["webhook_ms"]),
+        }
+        if result["sent_at"]:
+            entry["replies"] = f"{len(reply_ms)}/{len(result['sent_at'])}"
+            entry["reply_ms"] = summarize(reply_ms)
+        report["scenarios"][name] = entry
+    return report
+
+
+# --- Baseline comparison ---
+
+def compare(report: dict, baseline: dict, tolerance: float, slack_ms: float) -> list:
+    """
+    Returns regressions: latencies above baseline * (1 + tolerance) + slack, lower throughput,
+    more errors or lost replies. p95 is compared when both runs have MIN_P95_SAMPLES samples,
+    otherwise p50 (a p95 over a few dozen requests is mostly noise).
+    """
+    problems = []
+    for name, base in baseline.get("scenarios", {}).items():
+        current = report["scenarios"].get(name)
+        if current is None:
+            continue
+        for metric in ("webhook_ms", "reply_ms"):
+            base_stats, cur_stats = base.get(metric) or {}, current.get(metric) or {}
+            enough = min(base_stats.get("n", 0), cur_stats.get("n", 0)) >= MIN_P95_SAMPLES
+            key = "p95" if enough else "p50"
+            base_value, cur_value = base_stats.get(key), cur_stats.get(key)
+            if base_value is None or cur_value is None:
+                continue
+            limit = base_value * (1 + tolerance) + slack_ms
+            if cur_value > limit:
+                problems.append(f"{name} {metric} {key} {cur_value}ms > {limit:.1f}ms (baseline {base_value}ms)")
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            problems.append(f"{name} throughput {current['throughput_rps']} rps < baseline {base['throughput_rps']} rps")
+        if current["errors"] > base.get("errors", 0) + max(1, base.get("requests", 0) * 0.01):
+            problems.append(f"{name} errors {current['errors']} (baseline {base.get('errors', 0)})")
+        if "replies" in current:
+            got, wanted = (int(x) for x in current["replies"].split("/"))
+            if got < wanted:
+                problems.append(f"{name} only {current['replies']} replies arrived")
+    return problems
+
+
+# --- Process management ---
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def spawn(args) -> tuple:
+    """Starts the fake services and the bot. Returns (bot_url, fake_url, processes, log_path)."""
+    tmp = tempfile.mkdtemp(prefix="loadgen-")
+    log_path = os.path.join(tmp, "bot.log")
+    fake_port, bot_port = _free_port(), _free_port()
+    fake_url, bot_url = f"http://127.0.0.1:{fake_port}", f"http://127.0.0.1:{bot_port}"
+
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "bench", "fake_services.py"), "--port", str(fake_port),
+        "--graph-latency-ms", str(args.graph_latency_ms), "--graph-error-rate", str(args.graph_error_rate),
+        "--graph-429-rate", str(args.graph_429_rate),
+        "--openai-latency-ms", str(args.openai_latency_ms), "--openai-error-rate", str(args.openai_error_rate),
+    ], cwd=ROOT)
+
+    env = dict(
+        os.environ,
+        GRAPH_API_BASE_URL=fake_url,
+        OPENAI_BASE_URL=f"{fake_url}/v1",
+        OPENAI_API_KEY="bench",
+        WHATSAPP_TOKEN="bench",
+        PHONE_NUMBER_ID="bench",
+        VERIFY_TOKEN="bench",
+        BOT_DB_PATH=os.path.join(tmp, "bot.db"),
+        RATE_LIMIT_ENABLED="false",
+    )
+    with open(log_path, "w") as log:
+        bot = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(bot_port), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+    processes = [bot, fake]
+    try:
+        _wait_ready(f"{fake_url}/_stats")
+        _wait_ready(f"{bot_url}/health")
+        # The bot warms its AI pools (and imports openai) in the background right after startup.
+        time.sleep(args.settle)
+    except Exception:
+        for process in processes:
+            process.terminate()
+        raise
+    return bot_url, fake_url, processes, log_path
+
+
+def parse_rates(values: list) -> dict:
+    if not values:
+        return dict(DEFAULT_RATES)
+    rates = {name: 0.0 for name in DEFAULT_RATES}
+    for value in values:
+        name, _, rate = value.partition("=")
+        if name not in DEFAULT_RATES:
+            raise SystemExit(f"Unknown scenario '{name}' (choose from {', '.join(DEFAULT_RATES)})")
+        rates[name] = float(rate)
+    return rates
+
+
+def print_report(report: dict):
+    print(f"{'scenario':<10}{'reqs':>7}{'err':>5}{'rps':>8}   {'webhook p50/p95/p99 ms':<26}{'reply p50/p95/p99 ms':<26}{'replies':>9}")
+    fmt = lambda s: "/".join("-" if v is None else f"{v:g}" for v in (s["p50"], s["p95"], s["p99"]))
+    for name, s in report["scenarios"].items():
+        reply = fmt(s["reply_ms"]) if "reply_ms" in s else "-"
+        print(f"{name:<10}{s['requests']:>7}{s['errors']:>5}{s['throughput_rps']:>8}   "
+              f"{fmt(s['webhook_ms']):<26}{reply:<26}{s.get('replies', '-'):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20, help="seconds of traffic")
+    parser.add_argument("--settle", type=float, default=3, help="seconds to let a spawned bot finish warming up")
+    parser.add_argument("--drain", type=float, default=30, help="max seconds to wait for replies afterwards")
+    parser.add_argument("--rate", action="append", metavar="SCENARIO=RPS",
+                        help=f"requests per second per scenario (default {DEFAULT_RATES})")
+    parser.add_argument("--bot-url", help="target a running bot instead of spawning one")
+    parser.add_argument("--fake-url", help="fake services URL the running bot uses")
+    parser.add_argument("--graph-latency-ms", type=float, default=50)
+    parser.add_argument("--graph-error-rate", type=float, default=0.0)
+    parser.add_argument("--graph-429-rate", type=float, default=0.0)
+    parser.add_argument("--openai-latency-ms", type=float, default=500)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH", help="fail if latency/throughput regress against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--slack-ms", type=float, default=5.0, help="allowed absolute p95 regression")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    rates = parse_rates(args.rate)
+    processes, log_path = [], None
+    if args.bot_url:
+        if not args.fake_url:
+            raise SystemExit("--fake-url is required with --bot-url")
+        bot_url, fake_url = args.bot_url.rstrip("/"), args.fake_url.rstrip("/")
+    else:
+        bot_url, fake_url, processes, log_path = spawn(args)
+
+    try:
+        report = asyncio.run(run_load(bot_url, fake_url, rates, args.duration, args.drain))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=30)
+
+    report["config"] = {
+        "rates": rates,
+        "graph_latency_ms": args.graph_latency_ms,
+        "openai_latency_ms": args.openai_latency_ms,
+        "graph_error_rate": args.graph_error_rate,
+        "openai_error_rate": args.openai_error_rate,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+        if log_path:
+            print(f"bot log: {log_path}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("config", {}).get("rates") != rates:
+            print("warning: baseline was recorded with different rates")
+        problems = compare(report, baseline, args.tolerance, args.slack_ms)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        if problems:
+            return 1
+        print("no regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
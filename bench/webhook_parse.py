@@ -0,0 +1,98 @@
+"""
+Microbenchmark: per-payload parse cost of the webhook, old path vs. fast path.
+
+  full      stdlib json + WebhookPayload validation (what every POST used to cost)
+  fast      webhook_parser.loads + split_events, plus model validation only when
+            the delivery contains messages (what handle_webhook does now)
+
+    python bench/webhook_parse.py --number 20000
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("BOT_DB_PATH", os.path.join(ROOT, "data", "bench.db"))
+
+from app.main import WebhookPayload  # noqa: E402
+from app.services import webhook_parser  # noqa: E402
+
+
+def _delivery(messages=(), statuses=()) -> bytes:
+    return json.dumps({
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "102290129340398",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15550783881", "phone_number_id": "106540352242922"},
+                    "messages": list(messages),
+                    "statuses": list(statuses),
+                },
+            }],
+        }],
+    }).encode()
+
+
+def _status(i: int, status: str = "read") -> dict:
+    return {
+        "id": f"wamid.HBgLMTY1MDM4Nzk0MzkVAgARGBI{i:08d}",
+        "status": status,
+        "timestamp": "1750263773",
+        "recipient_id": f"2348012345{i % 1000:03d}",
+        "conversation": {"id": "93c9d42a2d5f8b1c", "origin": {"type": "utility"}},
+        "pricing": {"billable": True, "pricing_model": "CBP", "category": "utility"},
+    }
+
+
+def _message(i: int) -> dict:
+    return {
+        "from": f"2348012345{i % 1000:03d}",
+        "id": f"wamid.HBgLMTY1MDM4Nzk0MzkVAgASGBQz{i:08d}",
+        "timestamp": "1750263773",
+        "type": "text",
+        "text": {"body": "when is the CSC200 test?"},
+    }
+
+
+PAYLOADS = {
+    "status x1": _delivery(statuses=[_status(1)]),
+    "status x20": _delivery(statuses=[_status(i) for i in range(20)]),
+    "message x1": _delivery(messages=[_message(1)]),
+    "message x5 + status x5": _delivery(messages=[_message(i) for i in range(5)], statuses=[_status(i) for i in range(5)]),
+}
+
+
+def full_path(body: bytes):
+    return WebhookPayload.model_validate(json.loads(body))
+
+
+def fast_path(body: bytes):
+    raw = webhook_parser.loads(body)
+    has_messages, statuses = webhook_parser.split_events(raw)
+    if has_messages:
+        return WebhookPayload.model_validate(raw)
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="parses per measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="measurements per case (best is reported)")
+    args = parser.parse_args()
+
+    print(f"orjson available: {webhook_parser.ORJSON_AVAILABLE}")
+    print(f"{'payload':<24}{'bytes':>7}{'full us':>10}{'fast us':>10}{'speedup':>9}")
+    for name, body in PAYLOADS.items():
+        full = min(timeit.repeat(lambda: full_path(body), number=args.number, repeat=args.repeat)) / args.number
+        fast = min(timeit.repeat(lambda: fast_path(body), number=args.number, repeat=args.repeat)) / args.number
+        print(f"{name:<24}{len(body):>7}{full * 1e6:>10.2f}{fast * 1e6:>10.2f}{full / fast:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
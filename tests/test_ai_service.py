@@ -0,0 +1,26 @@
+from app.services import ai_service
+from app.services.conversation_memory import ConversationMemory
+from app.services.reply_cache import ReplyCache
+
+
+def test_history_based_reply_is_not_served_to_another_chat(monkeypatch):
+    calls = []
+
+    def fake_ai(prompt, system_prompt, temperature=0.7, max_tokens=150, history=None):
+        calls.append(history)
+        return "Friday, apparently 😅" if history else f"reply {len(calls)}"
+
+    monkeypatch.setattr(ai_service, "get_ai_response", fake_ai)
+    monkeypatch.setattr(ai_service, "reply_cache", ReplyCache(variants=1))
+    monkeypatch.setattr(ai_service, "chat_memory", ConversationMemory())
+
+    ai_service.chat_memory.add("chatA", "user", "the CSC201 test is Friday")
+    ai_service.chat_memory.add("chatA", "assistant", "Noted 📚")
+
+    assert ai_service.get_humorous_reply("When is the test??", chat_id="chatA") == "Friday, apparently 😅"
+    assert ai_service.get_humorous_reply("When is the test??", chat_id="chatB") == "reply 2"
+    assert len(calls) == 2 and calls[1] == []
+
+    # A context-free reply is still cached for chats that have no history either.
+    assert ai_service.get_humorous_reply("When is the test??", chat_id="chatC") == "reply 2"
+    assert len(calls) == 2
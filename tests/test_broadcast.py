@@ -0,0 +1,92 @@
+import time
+import asyncio
+
+from app.services.broadcast import Broadcaster, TargetRegistry
+from app.services.outbox import Outbox
+from app.services.whatsapp_client import WhatsAppSendError
+
+
+def test_groups_registered_by_one_worker_are_visible_to_another(tmp_path):
+    db_path = str(tmp_path / "bot.db")
+    a = TargetRegistry(db_path)
+    b = TargetRegistry(db_path)
+
+    assert a.add("CS101", ["111", "222", "222"]) == 2
+    assert b.has("cs101")
+    assert b.recipients("@cs101") == ["111", "222"]
+
+    assert b.remove("cs101", ["111"]) == 1
+    assert a.recipients("cs101") == ["222"]
+    assert a.aliases() == {"cs101": 1}
+
+
+def test_all_targets_every_registered_recipient(tmp_path):
+    registry = TargetRegistry(str(tmp_path / "bot.db"))
+    assert registry.has("all")
+    assert registry.recipients("all") == []
+
+    registry.add("cs101", ["111", "222"])
+    registry.add("cs102", ["222", "333"])
+    assert registry.recipients("all") == ["111", "222", "333"]
+
+
+def _rows(outbox):
+    return outbox._conn.execute("SELECT recipient_id, tag, locked_until, claimed_by FROM outbox ORDER BY id").fetchall()
+
+
+def test_broadcast_settles_every_recipient_through_the_outbox(tmp_path):
+    sent, tracked = [], []
+
+    async def send(recipient_id, message_body, message_type="text"):
+        if recipient_id == "flaky":
+            raise WhatsAppSendError("unavailable", status_code=503)
+        if recipient_id == "invalid":
+            raise WhatsAppSendError("bad number", status_code=400)
+        sent.append(recipient_id)
+        return {"messages": [{"id": f"wamid.{recipient_id}"}]}
+
+    outbox = Outbox(str(tmp_path / "bot.db"), send, on_sent=lambda row, response: tracked.append(row["tag"]))
+    broadcaster = Broadcaster(send, outbox, rate_per_second=0, max_attempts=2, base_backoff=0.01)
+
+    result = asyncio.run(broadcaster.broadcast(["111", "222", "flaky", "invalid"], "Class moved"))
+
+    assert sorted(sent) == ["111", "222"]
+    assert (result["sent"], result["deferred"], result["failed"], result["pending"]) == (2, 1, 1, 0)
+    assert tracked == [f"broadcast:{result['id']}"] * 2
+    # The deferred recipient stays queued for the outbox's own retries; the invalid one is dead-lettered.
+    [(recipient_id, tag, locked_until, claimed_by)] = _rows(outbox)
+    assert (recipient_id, tag, locked_until, claimed_by) == ("flaky", f"broadcast:{result['id']}", 0, None)
+    assert [row["recipient_id"] for row in outbox.dead_letters()] == ["invalid"]
+
+
+def test_interrupted_broadcast_leaves_unsent_recipients_in_the_outbox(tmp_path):
+    async def send(recipient_id, message_body, message_type="text"):
+        await asyncio.sleep(10)
+
+    outbox = Outbox(str(tmp_path / "bot.db"), send)
+    broadcaster = Broadcaster(send, outbox, rate_per_second=0)
+
+    async def run():
+        task = broadcaster.launch(broadcaster.broadcast(["111", "222", "333"], "Class moved"))
+        await asyncio.sleep(0.1)
+        await broadcaster.stop(timeout=0.1)
+        assert task.cancelled()
+
+    asyncio.run(run())
+    rows = _rows(outbox)
+    assert [row[0] for row in rows] == ["111", "222", "333"]
+    assert all(locked_until == 0 and claimed_by is None for _, _, locked_until, claimed_by in rows)
+    assert outbox.stats()["held"] == 0
+
+
+def test_reserved_rows_keep_their_lease_while_the_broadcast_runs(tmp_path):
+    outbox = Outbox(str(tmp_path / "bot.db"), None, claim_lease=1.0)
+    rows = outbox.reserve(["111"], "Class moved", tag="broadcast:abc")
+    outbox._conn.execute("UPDATE outbox SET locked_until = 0")
+
+    outbox._renew_claims()
+    [(_, _, locked_until, claimed_by)] = _rows(outbox)
+    assert locked_until > time.time() and claimed_by == outbox.owner_id
+
+    outbox.release([rows[0]["id"]])
+    assert outbox.stats()["held"] == 0
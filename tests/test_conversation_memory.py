@@ -0,0 +1,26 @@
+import time
+
+from app.services.conversation_memory import ConversationMemory
+
+
+def _counted_turns(memory):
+    return sum(len(turns) for _, turns in memory._chats.values())
+
+
+def test_turn_count_follows_adds_evictions_expiry_and_clear():
+    memory = ConversationMemory(max_turns=3, max_chats=2, idle_seconds=0.05)
+    for i in range(5):
+        memory.add("a", "user", f"a{i}")
+    memory.add("b", "user", "b0")
+    assert memory.stats()["turns"] == _counted_turns(memory) == 4
+
+    memory.add("c", "user", "c0")  # evicts "a"
+    assert memory.stats()["turns"] == _counted_turns(memory) == 2
+
+    memory.clear("b")
+    assert memory.stats()["turns"] == _counted_turns(memory) == 1
+
+    time.sleep(0.06)
+    assert memory.history("c") == []
+    assert memory.stats()["turns"] == _counted_turns(memory) == 0
+    assert (memory.evictions, memory.expirations) == (1, 1)
@@ -0,0 +1,47 @@
+import logging
+
+import pytest
+
+from app.services import logging_config
+
+
+@pytest.fixture
+def restore_logging():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    # Write out what the test queued while its captured stderr is still open.
+    logging_config.start_logging()
+    logging_config.stop_logging()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def test_uvicorn_access_lines_go_through_the_queue_and_can_be_sampled(restore_logging):
+    access_logger = logging.getLogger("uvicorn.access")
+    access_logger.addHandler(logging.StreamHandler())
+    access_logger.propagate = False
+
+    logging_config.configure_logging(level="INFO", sample_rates={"access": 0.0}, rate_limits={})
+    assert access_logger.handlers == [] and access_logger.propagate
+
+    access_logger.info('%s - "%s %s HTTP/%s" %d', "127.0.0.1:5000", "POST", "/webhook", "1.1", 200)
+    logging.getLogger("uvicorn.error").info("Application startup complete.")
+
+    stats = logging_config.logging_stats()
+    assert stats["dropped_by_category"] == {"access": 1}
+    assert stats["queued"] == 1
+
+
+def test_per_request_library_logs_are_kept_at_warning(restore_logging):
+    logging_config.configure_logging(level="INFO", sample_rates={}, rate_limits={})
+    logging.getLogger("httpx").info('HTTP Request: POST https://graph.facebook.com/v19.0/1/messages "HTTP/1.1 200 OK"')
+    logging.getLogger("apscheduler.executors.default").info('Job "lease_heartbeat" executed successfully')
+    logging.getLogger("httpx").warning("connection pool is full")
+    assert logging_config.logging_stats()["queued"] == 1
+
+    logging_config.configure_logging(level="DEBUG", sample_rates={}, rate_limits={})
+    assert logging.getLogger("httpx").getEffectiveLevel() == logging.DEBUG
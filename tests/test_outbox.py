@@ -0,0 +1,192 @@
+import time
+import asyncio
+
+from app.services.db import connect
+from app.services.outbox import Outbox
+from app.services.whatsapp_client import WhatsAppSendError
+
+
+class FakeSender:
+    """Records sent bodies; `failures[body]` is a list of errors raised on successive attempts."""
+
+    def __init__(self, failures: dict = None):
+        self.failures = {body: list(errors) for body, errors in (failures or {}).items()}
+        self.sent = []
+        self.attempts = []
+
+    async def __call__(self, recipient_id, message_body, message_type="text"):
+        self.attempts.append(message_body)
+        errors = self.failures.get(message_body)
+        if errors:
+            raise errors.pop(0)
+        self.sent.append(message_body)
+        return {"messages": [{"id": f"wamid.{len(self.sent)}"}]}
+
+
+def _outbox(db_path, sender, **kwargs):
+    options = {"sender_count": 4, "max_attempts": 3, "base_backoff": 0.05, "max_backoff": 0.2, "poll_interval": 0.02}
+    options.update(kwargs)
+    return Outbox(db_path, sender, **options)
+
+
+async def _drain(outbox, until, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not until() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+def test_transient_failure_keeps_recipient_order(tmp_path):
+    sender = FakeSender({"first": [WhatsAppSendError("unavailable", status_code=503)]})
+    outbox = _outbox(str(tmp_path / "bot.db"), sender)
+
+    async def run():
+        await outbox.start()
+        outbox.enqueue("r1", "first")
+        outbox.enqueue("r1", "second")
+        outbox.enqueue("r2", "other")
+        await _drain(outbox, lambda: len(sender.sent) == 3)
+        await outbox.stop(timeout=1)
+
+    asyncio.run(run())
+    assert [body for body in sender.sent if body != "other"] == ["first", "second"]
+    assert sender.attempts.count("first") == 2
+    assert outbox.stats()["retried"] == 1 and outbox.pending_count() == 0
+
+
+def test_retry_after_is_honored(tmp_path):
+    sender = FakeSender({"hello": [WhatsAppSendError("slow down", status_code=429, retry_after=0.3)]})
+    outbox = _outbox(str(tmp_path / "bot.db"), sender)
+
+    async def run():
+        await outbox.start()
+        started = time.monotonic()
+        outbox.enqueue("r1", "hello")
+        await _drain(outbox, lambda: sender.sent)
+        await outbox.stop(timeout=1)
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.3
+    assert sender.sent == ["hello"]
+
+
+def test_permanent_failure_is_dead_lettered_and_unblocks_recipient(tmp_path):
+    sender = FakeSender({"bad": [WhatsAppSendError("invalid recipient", status_code=400, error_code=131026)]})
+    outbox = _outbox(str(tmp_path / "bot.db"), sender)
+
+    async def run():
+        await outbox.start()
+        outbox.enqueue("r1", "bad", tag="broadcast:abc")
+        outbox.enqueue("r1", "next")
+        await _drain(outbox, lambda: sender.sent)
+        await outbox.stop(timeout=1)
+
+    asyncio.run(run())
+    assert sender.attempts == ["bad", "next"]
+    [dead] = outbox.dead_letters()
+    assert (dead["body"], dead["tag"], dead["attempts"], dead["status_code"]) == ("bad", "broadcast:abc", 1, 400)
+
+
+def test_messages_that_run_out_of_attempts_are_dead_lettered(tmp_path):
+    sender = FakeSender({"flaky": [WhatsAppSendError("down", status_code=502)] * 5})
+    outbox = _outbox(str(tmp_path / "bot.db"), sender, max_attempts=3)
+
+    async def run():
+        await outbox.start()
+        outbox.enqueue("r1", "flaky")
+        await _drain(outbox, lambda: outbox.stats()["dead_lettered"])
+        await outbox.stop(timeout=1)
+
+    asyncio.run(run())
+    assert sender.attempts == ["flaky"] * 3
+    assert outbox.dead_letters()[0]["attempts"] == 3
+    assert outbox.pending_count() == 0
+
+
+def test_rows_left_by_a_stopped_outbox_are_sent_after_restart(tmp_path):
+    db_path = str(tmp_path / "bot.db")
+    Outbox(db_path, FakeSender()).enqueue("r1", "queued while down")
+
+    sender = FakeSender()
+    outbox = _outbox(db_path, sender)
+
+    async def run():
+        await outbox.start()
+        assert outbox.pending_count() == 1
+        await _drain(outbox, lambda: sender.sent)
+        await outbox.stop(timeout=1)
+
+    asyncio.run(run())
+    assert sender.sent == ["queued while down"]
+
+
+def test_stop_only_releases_this_processes_claims(tmp_path):
+    db_path = str(tmp_path / "bot.db")
+    sender = FakeSender()
+    a = _outbox(db_path, sender)
+    b = _outbox(db_path, FakeSender())
+
+    b.enqueue("rb", "claimed by b")
+    [b_row], _ = b._claim(set(), 10)
+    a.enqueue("ra", "claimed by a")
+    [a_row], _ = a._claim(set(), 10)
+
+    async def run():
+        await a.start()
+        await asyncio.sleep(0.1)
+        await a.stop(timeout=1)
+
+    asyncio.run(run())
+    assert sender.sent == []
+    locks = dict((row_id, (locked_until, owner)) for row_id, locked_until, owner in
+                 a._conn.execute("SELECT id, locked_until, claimed_by FROM outbox"))
+    assert locks[a_row["id"]] == (0, None)
+    assert locks[b_row["id"]][0] > time.time() and locks[b_row["id"]][1] == b.owner_id
+
+
+def test_claimed_by_is_added_to_an_existing_outbox_table(tmp_path):
+    db_path = str(tmp_path / "bot.db")
+    connect(db_path).execute(
+        "CREATE TABLE outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, recipient_id TEXT NOT NULL, body TEXT NOT NULL,"
+        " message_type TEXT NOT NULL, tag TEXT, attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL,"
+        " locked_until REAL NOT NULL DEFAULT 0, created_at REAL NOT NULL, last_error TEXT)"
+    )
+    outbox = _outbox(db_path, FakeSender())
+    outbox.enqueue("r1", "hello")
+    [row], _ = outbox._claim(set(), 10)
+    assert outbox._conn.execute("SELECT claimed_by FROM outbox WHERE id = ?", (row["id"],)).fetchone()[0] == outbox.owner_id
+
+
+def test_slow_sends_are_not_claimed_twice_by_another_worker(tmp_path):
+    class SlowSender(FakeSender):
+        async def __call__(self, recipient_id, message_body, message_type="text"):
+            await asyncio.sleep(0.1)
+            return await super().__call__(recipient_id, message_body, message_type)
+
+    db_path = str(tmp_path / "bot.db")
+    first, second = SlowSender(), SlowSender()
+    # Leases shorter than the time the last row would wait behind a single sender.
+    busy = _outbox(db_path, first, sender_count=1, claim_lease=0.3)
+    idle = _outbox(db_path, second, sender_count=1, claim_lease=0.3)
+
+    async def run():
+        for i in range(6):
+            busy.enqueue(f"r{i}", f"m{i}")
+        await busy.start()
+        await asyncio.sleep(0.05)
+        await idle.start()
+        await _drain(busy, lambda: len(first.sent) + len(second.sent) >= 6)
+        await asyncio.sleep(0.3)
+        await busy.stop(timeout=1)
+        await idle.stop(timeout=1)
+
+    asyncio.run(run())
+    sent = first.sent + second.sent
+    assert sorted(sent) == [f"m{i}" for i in range(6)]
+
+
+def test_pending_count_covers_every_worker_sharing_the_file(tmp_path):
+    db_path = str(tmp_path / "bot.db")
+    a, b = Outbox(db_path, FakeSender()), Outbox(db_path, FakeSender())
+    a.enqueue("r1", "from a")
+    b.enqueue("r2", "from b")
+    assert a.pending_count() == b.pending_count() == 2
@@ -0,0 +1,44 @@
+import time
+
+from app.services.receipts import ReceiptSink, ReceiptStore
+
+
+def _store(tmp_path):
+    sink = ReceiptSink()
+    return sink, ReceiptStore(str(tmp_path / "bot.db"), sink, retention_days=1)
+
+
+def test_only_receipts_for_tracked_messages_are_stored(tmp_path):
+    sink, store = _store(tmp_path)
+    sink.record_sent("wamid.tracked", "broadcast:abc", "r1")
+    sink.add([
+        {"id": "wamid.tracked", "status": "delivered", "timestamp": "1700000000"},
+        {"id": "wamid.reply", "status": "delivered", "timestamp": "1700000000"},
+        {"id": "wamid.reply", "status": "read", "timestamp": "1700000001"},
+    ])
+    assert store.flush() == 2
+
+    # A read receipt arriving after its send was flushed is still counted.
+    sink.add([{"id": "wamid.tracked", "status": "read"}])
+    assert store.flush() == 1
+
+    stored = store._conn.execute("SELECT message_id, status FROM message_receipts ORDER BY status").fetchall()
+    assert stored == [("wamid.tracked", 1), ("wamid.tracked", 2)]
+    assert store.summaries(tag="broadcast:abc")[0]["read"] == 1
+
+
+def test_prune_removes_old_and_unstamped_receipts(tmp_path):
+    sink, store = _store(tmp_path)
+    now = int(time.time())
+    sink.record_sent("wamid.1", "broadcast:abc", "r1")
+    store.flush()
+    store._conn.executemany(
+        "INSERT INTO message_receipts (message_id, status, at, error_code) VALUES (?, ?, ?, NULL)",
+        [("wamid.1", 0, None), ("wamid.1", 1, now - 2 * 86400), ("wamid.1", 2, now)]
+    )
+    store._prune()
+    assert store._conn.execute("SELECT status FROM message_receipts").fetchall() == [(2,)]
+    plan = " ".join(row[3] for row in store._conn.execute(
+        "EXPLAIN QUERY PLAN DELETE FROM message_receipts WHERE at < ? OR at IS NULL", (now,)
+    ))
+    assert "idx_message_receipts_at" in plan
@@ -0,0 +1,28 @@
+from app.services.reminder_dispatch import ReminderDispatcher
+
+
+def test_flush_merges_reminders_per_recipient_and_counts_failures():
+    queued = []
+
+    def send(recipient_id, text):
+        queued.append((recipient_id, text))
+        return recipient_id != "bad"
+
+    dispatcher = ReminderDispatcher(window=60)
+    dispatcher.set_sender(send)
+    dispatcher.submit("111", "Submit report")
+    dispatcher.submit("111", "Bring lab coat")
+    dispatcher.submit("bad", "Quiz at 9")
+    dispatcher.flush()
+
+    assert [recipient_id for recipient_id, _ in queued] == ["111", "bad"]
+    assert "• Submit report" in queued[0][1] and "• Bring lab coat" in queued[0][1]
+    stats = dispatcher.stats()
+    assert (stats["reminders"], stats["deliveries"], stats["merged"], stats["failed"], stats["pending"]) == (3, 2, 1, 1, 0)
+
+
+def test_flush_without_sender_counts_every_delivery_as_failed():
+    dispatcher = ReminderDispatcher(window=60)
+    dispatcher.submit("111", "Submit report")
+    dispatcher.flush()
+    assert dispatcher.stats()["failed"] == 1
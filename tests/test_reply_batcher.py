@@ -0,0 +1,26 @@
+import asyncio
+
+from app.services.reply_batcher import ReplyBatcher
+
+
+def test_messages_with_history_are_batched_with_their_own_history():
+    calls = []
+
+    async def complete_batch(messages, histories):
+        calls.append(("batch", messages, histories))
+        return [f"re: {message}" for message in messages]
+
+    async def complete_single(message, history):
+        calls.append(("single", message, history))
+        return f"single: {message}"
+
+    batcher = ReplyBatcher(complete_batch, complete_single, window_ms=10, max_batch_size=8)
+
+    async def run():
+        return await asyncio.gather(
+            batcher.submit("hi", [("user", "earlier"), ("assistant", "hello")]),
+            batcher.submit("yo"),
+        )
+
+    assert asyncio.run(run()) == ["re: hi", "re: yo"]
+    assert calls == [("batch", ["hi", "yo"], [[("user", "earlier"), ("assistant", "hello")], None])]
@@ -0,0 +1,47 @@
+import pytest
+
+from app.services import webhook_parser
+from app.services.receipts import ReceiptSink
+
+
+def _delivery(value):
+    return {"object": "whatsapp_business_account", "entry": [{"id": "1", "changes": [{"field": "messages", "value": value}]}]}
+
+
+def test_split_events_returns_receipts_and_message_flag():
+    statuses = [{"id": "wamid.1", "status": "delivered"}, {"id": "wamid.2", "status": "read"}]
+    assert webhook_parser.split_events(_delivery({"statuses": statuses})) == (False, statuses)
+    assert webhook_parser.split_events(_delivery({"messages": [{"id": "wamid.3"}]})) == (True, [])
+
+
+@pytest.mark.parametrize("payload", [
+    None,
+    [],
+    "entry",
+    {"entry": 5},
+    {"entry": "abc"},
+    {"entry": {"changes": []}},
+    {"entry": [5, None, "x"]},
+    {"entry": [{"changes": 5}]},
+    {"entry": [{"changes": {"field": "messages"}}]},
+    {"entry": [{"changes": [5, {"field": "messages", "value": 5}]}]},
+    {"entry": [{"changes": [{"field": "messages", "value": {"statuses": 5}}]}]},
+    {"entry": [{"changes": [{"field": "messages", "value": {"statuses": [5, "x"]}}]}]},
+])
+def test_split_events_skips_malformed_parts(payload):
+    assert webhook_parser.split_events(payload) == (False, [])
+
+
+def test_receipt_sink_ignores_malformed_statuses():
+    sink = ReceiptSink()
+    sink.add([
+        {"id": "wamid.1", "status": "failed", "errors": 5},
+        {"id": "wamid.2", "status": ["read"]},
+        {"id": ["wamid.3"], "status": "read"},
+        {"id": "wamid.4", "status": "failed", "errors": [{"code": 131026}]},
+    ])
+    _, receipts = sink.drain()
+    assert [(message_id, code, error_code) for message_id, code, _, error_code in receipts] == [
+        ("wamid.1", 3, None),
+        ("wamid.4", 3, 131026),
+    ]